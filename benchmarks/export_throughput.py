@@ -0,0 +1,73 @@
+"""
+End-to-end throughput benchmark of timetree-exporter against the local fake
+TimeTree API server.
+
+    python benchmarks/export_throughput.py --events 100000 --latency 0.05
+
+Extra arguments after `--` are passed to timetree-exporter, e.g.
+`-- --incremental`. Reports the wall-clock time, events per second and the
+peak resident memory of the exporter process.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from timetree_exporter.fake_server import (
+    FakeTimeTreeServer,
+    add_config_arguments,
+    config_from_args,
+)
+
+
+def peak_rss_mib() -> float:
+    """Return the peak resident memory of the finished child processes in MiB."""
+    try:
+        import resource  # pylint: disable=C0415
+    except ImportError:  # Not available on Windows
+        return float("nan")
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_config_arguments(parser)
+    parser.add_argument(
+        "exporter_args", nargs="*", help="Arguments passed to timetree-exporter"
+    )
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    with FakeTimeTreeServer(config) as server, tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "TIMETREE_API_BASEURI": server.base_uri,
+            "TIMETREE_EMAIL": config.email,
+            "TIMETREE_PASSWORD": config.password,
+            "TIMETREE_CACHE_DIR": os.path.join(tmp, "cache"),
+        }
+        output = os.path.join(tmp, "timetree.ics")
+        command = [sys.executable, "-m", "timetree_exporter", "-a", "--merge"]
+        command += ["-o", output, *args.exporter_args]
+
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+
+        total = args.calendars * args.events
+        print(f"events:      {total}")
+        print(f"requests:    {server.stats}")
+        print(f"elapsed:     {elapsed:.2f} s")
+        print(f"throughput:  {total / elapsed:,.0f} events/s")
+        print(f"peak RSS:    {peak_rss_mib():.1f} MiB")
+        print(f"output size: {os.path.getsize(output) / (1024 * 1024):.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Tests of the asynchronous API client against the fake server."""
+
+import asyncio
+
+import pytest
+
+from timetree_exporter.api.auth import AuthenticationError
+from timetree_exporter.fake_server import (
+    FakeServerConfig,
+    FakeTimeTreeServer,
+    make_event,
+)
+
+aiohttp = pytest.importorskip("aiohttp")
+
+# pylint: disable=wrong-import-position
+from timetree_exporter.api.aio import AsyncTimeTreeClient
+
+
+def run_client(server: FakeTimeTreeServer, func, **kwargs):
+    """Run func(client, calendar) with a client logged in to the fake server."""
+
+    async def main():
+        async with AsyncTimeTreeClient(
+            base_uri=server.base_uri, backoff_factor=0.01, **kwargs
+        ) as client:
+            session_id = await client.login(server.config.email, server.config.password)
+            return await func(client, client.calendar(session_id))
+
+    return asyncio.run(main())
+
+
+def test_events_in_chunks():
+    """Test fetching all events of a calendar, one sync chunk at a time."""
+    config = FakeServerConfig(calendars=2, events=25, chunk_size=10)
+
+    async def fetch(_, calendar):
+        metadatas = await calendar.get_metadata()
+        chunks = [
+            chunk async for chunk in calendar.iter_event_chunks(metadatas[1]["id"])
+        ]
+        return metadatas, chunks
+
+    with FakeTimeTreeServer(config) as server:
+        metadatas, chunks = run_client(server, fetch)
+        assert server.stats["chunks"] == 3
+    assert [metadata["alias_code"] for metadata in metadatas] == ["fake1", "fake2"]
+    assert [len(chunk.events) for chunk in chunks] == [10, 10, 5]
+    assert [chunk.chunk for chunk in chunks] == [True, True, False]
+    events = [event for chunk in chunks for event in chunk.events]
+    assert events == [make_event(2, index) for index in range(25)]
+
+
+def test_retry_transient_errors():
+    """Test that 503 responses are retried until the request succeeds."""
+    config = FakeServerConfig(events=100, chunk_size=10, error_rate=0.3)
+
+    async def fetch(_, calendar):
+        return await calendar.get_events(1)
+
+    with FakeTimeTreeServer(config) as server:
+        events = run_client(server, fetch, retries=20)
+        assert server.stats["errors"] > 0
+    assert events == [make_event(1, index) for index in range(100)]
+
+
+def test_retries_exhausted():
+    """Test that the last error is reported once the retries are exhausted."""
+    config = FakeServerConfig(error_rate=1.0)
+
+    async def fetch(_, calendar):
+        return await calendar.get_metadata()
+
+    with FakeTimeTreeServer(config) as server:
+        with pytest.raises(Exception, match="metadata"):
+            run_client(server, fetch, retries=2)
+        assert server.stats["errors"] == 3
+
+
+@pytest.mark.parametrize("error", ["connection", "timeout"])
+def test_retry_connection_errors(error):
+    """Test that connection errors and timeouts are retried like 503 responses."""
+    config = FakeServerConfig(events=5)
+    errors = {
+        "connection": aiohttp.ClientConnectionError("reset"),
+        "timeout": asyncio.TimeoutError(),
+    }
+    failures = []
+
+    async def fetch(client, calendar):
+        request = client.session.request
+
+        def failing_request(*args, **kwargs):
+            if len(failures) < 2:
+                failures.append(args)
+                raise errors[error]
+            return request(*args, **kwargs)
+
+        client.session.request = failing_request
+        return await calendar.get_events(1)
+
+    with FakeTimeTreeServer(config) as server:
+        events = run_client(server, fetch)
+    assert len(failures) == 2
+    assert events == [make_event(1, index) for index in range(5)]
+
+
+def test_reauthenticate_on_expired_session():
+    """Test that a rejected session is refreshed once for concurrent requests."""
+    config = FakeServerConfig(calendars=2, events=5)
+    rejected = []
+
+    async def fetch(client, calendar):
+        async def reauthenticate(session_id):
+            rejected.append(session_id)
+            return await client.login(config.email, config.password)
+
+        calendar.session_id = "0" * 32
+        calendar.reauthenticate = reauthenticate
+        return await asyncio.gather(calendar.get_events(1), calendar.get_events(2))
+
+    with FakeTimeTreeServer(config) as server:
+        events = run_client(server, fetch)
+        assert server.stats["logins"] == 2
+    assert rejected == ["0" * 32]
+    assert events[1] == [make_event(2, index) for index in range(5)]
+
+
+def test_login_failure():
+    """Test that invalid credentials raise an AuthenticationError."""
+
+    async def login(server):
+        async with AsyncTimeTreeClient(base_uri=server.base_uri) as client:
+            await client.login(server.config.email, "wrong")
+
+    with FakeTimeTreeServer() as server:
+        with pytest.raises(AuthenticationError):
+            asyncio.run(login(server))
@@ -0,0 +1,44 @@
+"""Tests for the auth module."""
+
+import os
+import stat
+
+from timetree_exporter.api import auth
+from timetree_exporter.api.auth import SessionCache
+
+
+def test_session_cache_reuses_session(tmp_path, monkeypatch):
+    """Test that the cached session is reused until it is reported stale."""
+    logins = []
+
+    def fake_login(email, password, base_uri):
+        logins.append((email, password, base_uri))
+        return f"session-{len(logins)}"
+
+    monkeypatch.setattr(auth, "login", fake_login)
+
+    cache = SessionCache(str(tmp_path), "http://localhost/api/v1")
+    assert cache.login("user@example.com", "password") == "session-1"
+    assert logins == [("user@example.com", "password", "http://localhost/api/v1")]
+    # Another process sharing the cache directory reuses the session
+    assert SessionCache(str(tmp_path)).login("user@example.com", "password") == (
+        "session-1"
+    )
+    assert len(logins) == 1
+
+    # A rejected session is replaced by a new login
+    assert cache.login("user@example.com", "password", "session-1") == "session-2"
+    # A session that was already refreshed by someone else is reused
+    assert cache.login("user@example.com", "password", "session-1") == "session-2"
+    assert len(logins) == 2
+
+
+def test_session_cache_is_private(tmp_path, monkeypatch):
+    """Test that the session cache is only readable by its owner."""
+    monkeypatch.setattr(auth, "login", lambda *args: "session-1")
+    cache = SessionCache(str(tmp_path))
+    cache.login("user@example.com", "password")
+    if os.name != "nt":
+        assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+    # No temporary file is left behind
+    assert sorted(os.listdir(tmp_path)) == ["sessions.json", "sessions.lock"]
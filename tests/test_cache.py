@@ -0,0 +1,58 @@
+"""Tests for the response cache module."""
+
+import json
+
+import pytest
+
+from timetree_exporter.api.auth import login
+from timetree_exporter.api.cache import ResponseCache, ResponseCacheMiss
+from timetree_exporter.api.calendar import TimeTreeCalendar
+from timetree_exporter.api.const import API_BASEURI
+from timetree_exporter.fake_server import (
+    FakeServerConfig,
+    FakeTimeTreeServer,
+    make_event,
+)
+
+
+def test_replay_recorded_responses(tmp_path):
+    """Test that recorded sync responses are served back in replay mode."""
+    url = f"{API_BASEURI}/calendar/1/events/sync"
+    cache = ResponseCache(str(tmp_path))
+    cache.save(
+        url,
+        None,
+        json.dumps({"events": [{"uuid": "a"}], "since": 10, "chunk": True}).encode(),
+    )
+    cache.save(
+        url,
+        {"since": 10},
+        json.dumps({"events": [{"uuid": "b"}], "since": 20, "chunk": False}).encode(),
+    )
+
+    calendar = TimeTreeCalendar(None)
+    calendar.response_cache = ResponseCache(str(tmp_path), replay=True)
+    assert [event["uuid"] for event in calendar.iter_events(1)] == ["a", "b"]
+
+    with pytest.raises(ResponseCacheMiss):
+        calendar.fetch_chunk(2)
+
+
+def test_record_then_replay(tmp_path):
+    """Test that the sync chunks fetched in record mode can be replayed."""
+    config = FakeServerConfig(events=25, chunk_size=10)
+    with FakeTimeTreeServer(config) as server:
+        session_id = login(config.email, config.password, server.base_uri)
+        calendar = TimeTreeCalendar(session_id)
+        calendar.base_uri = server.base_uri
+        calendar.response_cache = ResponseCache(str(tmp_path))
+        recorded = [calendar.fetch_chunk(1)]
+        while recorded[-1].chunk:
+            recorded.append(calendar.fetch_chunk(1, since=recorded[-1].since))
+
+    calendar = TimeTreeCalendar(None)
+    calendar.base_uri = server.base_uri
+    calendar.response_cache = ResponseCache(str(tmp_path), replay=True)
+    assert calendar.fetch_chunk(1) == recorded[0]
+    assert list(calendar.iter_events(1)) == [make_event(1, i) for i in range(25)]
+    assert not list((tmp_path / "responses").glob("*.tmp"))
@@ -2,6 +2,7 @@
 
 from timetree_exporter.event import (
     TimeTreeEvent,
+    TimeTreeEventView,
     TimeTreeEventType,
     TimeTreeEventCategory,
 )
@@ -156,3 +157,40 @@ def test_get_ical_color():
     event_data["label_id"] = "invalid"
     event = TimeTreeEvent.from_dict(event_data)
     assert event.get_ical_color() is None
+
+
+def test_from_dicts(normal_event_data, memo_event_data):
+    """Test creating many TimeTreeEvents at once."""
+    partial_event_data = {"uuid": "test-uuid-partial", "title": "Partial"}
+    events = TimeTreeEvent.from_dicts(
+        [normal_event_data, partial_event_data, memo_event_data]
+    )
+
+    assert [event.uuid for event in events] == [
+        "test-uuid-normal",
+        "test-uuid-partial",
+        "test-uuid-memo",
+    ]
+    assert events[0].event_type == normal_event_data["type"]
+    assert events[0].recurrences == normal_event_data["recurrences"]
+    assert events[1].start_timezone is None
+    assert events[2].category == memo_event_data["category"]
+    # Timezone names are shared between events
+    assert events[0].start_timezone is events[2].end_timezone
+
+    # Events have no per-instance __dict__
+    assert not hasattr(events[0], "__dict__")
+
+
+def test_event_view(normal_event_data, birthday_event_data):
+    """Test that a TimeTreeEventView reads the same values as a TimeTreeEvent."""
+    for event_data in (normal_event_data, birthday_event_data, {}):
+        view = TimeTreeEventView.from_dict(event_data)
+        event = TimeTreeEvent.from_dict(event_data)
+        for attribute in TimeTreeEvent.__slots__:
+            assert getattr(view, attribute) == getattr(event, attribute)
+        assert view.get_ical_color() == event.get_ical_color()
+
+    view = TimeTreeEventView(normal_event_data)
+    assert view.event_data is normal_event_data
+    assert str(view) == normal_event_data["title"]
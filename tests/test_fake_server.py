@@ -0,0 +1,77 @@
+"""End-to-end tests of the API clients against the fake server."""
+
+import pytest
+
+from timetree_exporter.api.auth import AuthenticationError, login
+from timetree_exporter.api.calendar import TimeTreeCalendar
+from timetree_exporter.fake_server import (
+    FakeServerConfig,
+    FakeTimeTreeServer,
+    make_event,
+)
+
+
+@pytest.fixture
+def fake_server():
+    """Run a fake server with a small chunked calendar and transient errors."""
+    config = FakeServerConfig(calendars=2, events=25, chunk_size=10, error_rate=0.2)
+    with FakeTimeTreeServer(config) as server:
+        yield server
+
+
+def connect(server: FakeTimeTreeServer) -> TimeTreeCalendar:
+    """Log in to the fake server and return the calendar API."""
+    session_id = login(server.config.email, server.config.password, server.base_uri)
+    calendar = TimeTreeCalendar(session_id, backoff_factor=0.01, retries=10)
+    calendar.base_uri = server.base_uri
+    return calendar
+
+
+def test_export_from_fake_server(fake_server):  # pylint: disable=W0621
+    """Test fetching all events of a calendar in chunks."""
+    calendar = connect(fake_server)
+    metadatas = calendar.get_metadata()
+    assert [metadata["alias_code"] for metadata in metadatas] == ["fake1", "fake2"]
+
+    events = calendar.get_events(metadatas[1]["id"], metadatas[1]["name"])
+    assert events == [make_event(2, index) for index in range(25)]
+    assert fake_server.stats["chunks"] == 3
+
+
+def test_compressed_chunks_are_decoded(fake_server):  # pylint: disable=W0621
+    """Test that sync chunks are sent compressed and decoded while streamed."""
+    calendar = connect(fake_server)
+    response = calendar.get(f"{fake_server.base_uri}/calendar/1/events/sync")
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    chunk = calendar.fetch_chunk(1)
+    assert chunk.events == [make_event(1, index) for index in range(10)]
+    assert chunk.chunk
+
+
+def test_login_failure(fake_server):  # pylint: disable=W0621
+    """Test that invalid credentials raise an AuthenticationError."""
+    with pytest.raises(AuthenticationError):
+        login(fake_server.config.email, "wrong", fake_server.base_uri)
+
+
+def test_reauthenticate_on_expired_session(fake_server):  # pylint: disable=W0621
+    """Test that a rejected session is refreshed once."""
+    calendar = connect(fake_server)
+    calendar.set_session_id("0" * 32)
+    rejected = []
+
+    def reauthenticate(stale_session_id):
+        rejected.append(stale_session_id)
+        return login(
+            fake_server.config.email, fake_server.config.password, fake_server.base_uri
+        )
+
+    calendar.reauthenticate = reauthenticate
+    # Replaced by another thread since the cookie was set
+    calendar.session_id = "1" * 32
+
+    assert len(calendar.get_metadata()) == 2
+    assert fake_server.stats["logins"] == 2
+    # The session reported stale is the one sent with the rejected request
+    assert rejected == ["0" * 32]
@@ -0,0 +1,107 @@
+"""Tests for the filters module."""
+
+import random
+
+import pytest
+
+from timetree_exporter.event import TimeTreeEventView
+from timetree_exporter.filters import (
+    EventFilter,
+    filter_events,
+    parse_label,
+    parse_window_bound,
+)
+
+
+def test_filter_skips_unsupported(
+    normal_event_data, birthday_event_data, memo_event_data
+):
+    """Test that birthdays and memos are dropped before conversion."""
+    counts = {}
+    events = [normal_event_data, birthday_event_data, memo_event_data]
+    assert list(filter_events(events, counts=counts)) == [normal_event_data]
+    assert counts == {"filtered": 2}
+
+
+def test_filter_conditions(normal_event_data):
+    """Test each condition on a raw event."""
+    normal_event_data["label_id"] = "3"
+    normal_event_data["recurrences"] = None
+    accepted = [
+        EventFilter(),
+        EventFilter(labels=frozenset([3, 4])),
+        EventFilter(updated_since=normal_event_data["updated_at"]),
+        EventFilter(title="一般"),
+        EventFilter(start=normal_event_data["end_at"] - 1),
+        EventFilter(end=normal_event_data["start_at"] + 1),
+    ]
+    rejected = [
+        EventFilter(event_types=frozenset([99])),
+        EventFilter(categories=frozenset([99])),
+        EventFilter(labels=frozenset([1])),
+        EventFilter(updated_since=normal_event_data["updated_at"] + 1),
+        EventFilter(title="^Meeting"),
+        EventFilter(start=normal_event_data["end_at"]),
+        EventFilter(end=normal_event_data["start_at"]),
+    ]
+    assert all(event_filter(normal_event_data) for event_filter in accepted)
+    assert not any(event_filter(normal_event_data) for event_filter in rejected)
+
+
+def test_filter_window_matches_scan():
+    """Test that the window filter selects the events overlapping the window."""
+    rng = random.Random(0)
+    events = []
+    for index in range(500):
+        start = rng.randrange(0, 10_000)
+        end = start + rng.choice([0, 1, 10, 100, 5000])
+        events.append({"uuid": f"uuid-{index}", "start_at": start, "end_at": end})
+    events[0]["recurrences"] = ["RRULE:FREQ=DAILY"]
+    for start, end in [(0, 100), (2500, 2600), (5000, None), (None, 10)]:
+        event_filter = EventFilter(start=start, end=end, skip_unsupported=False)
+        expected = [
+            event
+            for event in events
+            if (end is None or event["start_at"] < end)
+            and (
+                start is None
+                or "recurrences" in event
+                or max(event["end_at"], event["start_at"] + 1) > start
+            )
+        ]
+        assert list(filter_events(events, event_filter)) == expected
+
+
+def test_filter_window_recurring(normal_event_data):
+    """Test that recurring events are kept in windows after their first occurrence."""
+    once = {**normal_event_data, "uuid": "once", "recurrences": None}
+    weekly = {**normal_event_data, "uuid": "weekly"}
+    later = normal_event_data["end_at"] + 7 * 24 * 3600 * 1000
+
+    event_filter = EventFilter(start=later, end=later + 1000)
+    assert list(filter_events([once, weekly], event_filter)) == [weekly]
+
+
+def test_filter_builds_no_events(monkeypatch, normal_event_data):
+    """Test that filtering works on the raw events only."""
+
+    def init(*args):
+        raise AssertionError("Event object built")
+
+    monkeypatch.setattr(TimeTreeEventView, "__init__", init)
+    assert list(filter_events([normal_event_data], EventFilter(title="測試")))
+
+
+def test_parse_label():
+    """Test that labels are parsed by number or color name."""
+    assert parse_label("3") == 3
+    assert parse_label("Teal") == 1
+    with pytest.raises(ValueError):
+        parse_label("pink")
+
+
+def test_parse_window_bound():
+    """Test that a date as the end of a window includes the whole day."""
+    start = parse_window_bound("2024-05-01")
+    assert parse_window_bound("2024-05-01", is_end=True) - start == 24 * 3600 * 1000
+    assert parse_window_bound("2024-05-01T12:00") - start == 12 * 3600 * 1000
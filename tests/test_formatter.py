@@ -11,7 +11,7 @@ from timetree_exporter.event import (
     TimeTreeEventType,
     TimeTreeEventCategory,
 )
-from timetree_exporter.formatter import ICalEventFormatter
+from timetree_exporter.formatter import ICalEventFormatter, parse_recurrence_parts
 from timetree_exporter.utils import convert_timestamp_to_datetime
 
 
@@ -296,3 +296,25 @@ def test_multi_day_all_day_event():
     ical_event = formatter.to_ical()
     assert ical_event["dtstart"].dt.date() == start_date.date()
     assert ical_event["dtend"].dt.date() == expected_end_date
+
+
+def test_recurrences_are_parsed_once(normal_event_data):
+    """Test that identical recurrence lines are parsed once, not shared."""
+    parse_recurrence_parts.cache_clear()
+    normal_event_data["recurrences"].append("EXDATE;TZID=Asia/Taipei:20240410T000000")
+    events = [
+        ICalEventFormatter(TimeTreeEvent.from_dict(normal_event_data)).to_ical()
+        for _ in range(3)
+    ]
+
+    info = parse_recurrence_parts.cache_info()
+    assert (info.hits, info.misses) == (4, 2)
+    assert events[0]["rrule"] == events[2]["rrule"]
+    assert events[0]["rrule"] is not events[2]["rrule"]
+
+    # Modifying the recurrences of an event leaves the other events unchanged
+    events[0]["rrule"]["COUNT"] = [10]
+    events[0]["exdate"].params["TZID"] = "UTC"
+    ical = events[2].to_ical()
+    assert ical.count(b"RRULE:FREQ=WEEKLY;COUNT=5") == 1
+    assert b"EXDATE;TZID=Asia/Taipei:20240410T000000" in ical
@@ -0,0 +1,118 @@
+"""Differential tests of the direct ICS writer against the icalendar path."""
+
+from datetime import datetime
+from zoneinfo import ZoneInfo, available_timezones
+
+import pytest
+
+from timetree_exporter.event import TimeTreeEvent
+from timetree_exporter.fake_server import make_event
+from timetree_exporter.formatter import ICalEventFormatter
+from timetree_exporter.ics import ICalEventWriter, format_duration
+from timetree_exporter.pipeline import export_events, used_tzids
+from timetree_exporter.tz import DAY, registry
+
+DTSTAMP = datetime(2024, 1, 2, 3, 4, 5, tzinfo=ZoneInfo("UTC"))
+
+
+def icalendar_bytes(event_data: dict) -> bytes:
+    """Serialize an event with icalendar, with a fixed DTSTAMP."""
+    ical_event = ICalEventFormatter(TimeTreeEvent.from_dict(event_data)).to_ical()
+    if ical_event is None:
+        return None
+    ical_event.pop("dtstamp")
+    ical_event.add("dtstamp", DTSTAMP)
+    return ical_event.to_ical()
+
+
+def assert_same_output(event_data: dict):
+    """Assert that both serializers produce the same bytes and TZIDs."""
+    expected = icalendar_bytes(event_data)
+    written = ICalEventWriter(DTSTAMP).to_ical(TimeTreeEvent.from_dict(event_data))
+    if expected is None:
+        assert written is None
+        return
+    ical_bytes, tzids = written
+    assert ical_bytes == expected
+    ical_event = ICalEventFormatter(TimeTreeEvent.from_dict(event_data)).to_ical()
+    assert tzids == used_tzids(ical_event)
+
+
+def test_fixture_events(normal_event_data, birthday_event_data, memo_event_data):
+    """Test the events of the test fixtures."""
+    for event_data in (normal_event_data, birthday_event_data, memo_event_data):
+        assert_same_output(event_data)
+
+
+def test_synthetic_events():
+    """Test a few thousand generated events of every kind."""
+    for index in range(2000):
+        assert_same_output(make_event(1, index, seed=7))
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"title": "長い日本語のタイトル" * 10, "note": "a;b,c\\d\r\nline\n" * 5},
+        {"location": "x" * 200, "url": "https://example.com/?a=1,b;c"},
+        {"parent_id": "p;1", "label_id": 3, "alerts": [0, 1440, 1500, 20000]},
+        {
+            "recurrences": [
+                "EXDATE;TZID=Asia/Tokyo:20240410T090000,20240411T090000",
+                "RRULE:FREQ=WEEKLY;BYDAY=MO,WE;INTERVAL=2",
+                "RDATE;VALUE=DATE:20240501",
+            ]
+        },
+        {
+            "start_at": -400 * 86400000,
+            "end_at": -399 * 86400000,
+            "start_timezone": "UTC",
+            "end_timezone": "UTC",
+        },
+        {"all_day": True, "start_timezone": "America/New_York"},
+        {"location_lat": "35", "location_lon": "1e-7"},
+    ],
+)
+def test_edge_cases(normal_event_data, changes):
+    """Test escaping, folding, parameters and unusual values."""
+    assert_same_output({**normal_event_data, **changes})
+
+
+def test_all_timezones(monkeypatch, normal_event_data):
+    """
+    Test every timezone known to zoneinfo, including those icalendar writes
+    as UTC times.
+    """
+    # Only build offset tables around the event, there is one per timezone
+    start_at = normal_event_data["start_at"]
+    monkeypatch.setattr(registry, "start", start_at - DAY)
+    monkeypatch.setattr(registry, "end", start_at + DAY)
+    monkeypatch.setattr(registry, "tables", {})
+    timezones = sorted(available_timezones())
+    for index, timezone in enumerate(timezones):
+        assert_same_output(
+            {
+                **normal_event_data,
+                "start_timezone": timezone,
+                "end_timezone": timezones[index - 1],
+            }
+        )
+
+
+def test_format_duration():
+    """Test that alert triggers are formatted like icalendar's vDuration."""
+    assert format_duration(datetime(2024, 1, 1) - datetime(2024, 1, 1)) == "P0D"
+    assert format_duration(DTSTAMP - DTSTAMP.replace(minute=19)) == "-PT15M"
+
+
+def test_export_events_direct(normal_event_data, birthday_event_data):
+    """Test that the direct serializer can be used in the export pipeline."""
+    counts = {}
+    serialized = list(
+        export_events(
+            [normal_event_data, birthday_event_data], counts, serializer="direct"
+        )
+    )
+    assert len(serialized) == 1
+    assert serialized[0][1] == {"Asia/Taipei"}
+    assert counts == {"read": 2, "converted": 1}
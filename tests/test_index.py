@@ -0,0 +1,80 @@
+"""Tests for the index module."""
+
+import datetime
+import random
+from zoneinfo import ZoneInfo
+
+from timetree_exporter.event import TimeTreeEventView
+from timetree_exporter.index import EventIndex, select_window
+
+
+def make_events(count: int, seed: int = 0) -> list:
+    """Generate events with random spans, some without a duration."""
+    rng = random.Random(seed)
+    events = []
+    for index in range(count):
+        start = rng.randrange(0, 10_000)
+        events.append(
+            {
+                "uuid": f"uuid-{index}",
+                "start_at": start,
+                "end_at": start + rng.choice([0, 1, 10, 100, 5000]),
+                "recurrences": None,
+            }
+        )
+    return events
+
+
+def test_overlapping_matches_scan():
+    """Test that range queries return the same events as a full scan."""
+    events = make_events(500)
+    index = EventIndex.from_dicts(events)
+    rng = random.Random(1)
+    for _ in range(200):
+        start = rng.randrange(-100, 11_000)
+        end = start + rng.randrange(1, 2000)
+        expected = [
+            event
+            for event in events
+            if event["start_at"] < end
+            and max(event["end_at"], event["start_at"] + 1) > start
+        ]
+        assert [view.event_data for view in index.overlapping(start, end)] == expected
+    assert len(index.overlapping()) == len(events)
+
+
+def test_point_and_date_queries(normal_event_data):
+    """Test the point in time and calendar day queries."""
+    normal_event_data["recurrences"] = None
+    index = EventIndex([TimeTreeEventView(normal_event_data)])
+    start_at = normal_event_data["start_at"]
+
+    assert len(index.at(start_at)) == 1
+    assert not index.at(normal_event_data["end_at"])
+    taipei = ZoneInfo("Asia/Taipei")
+    day = datetime.datetime.fromtimestamp(start_at / 1000, taipei).date()
+    assert len(index.on_date(day, taipei)) == 1
+    assert not index.on_date(day + datetime.timedelta(days=1), taipei)
+
+
+def test_select_window_recurring(normal_event_data):
+    """Test that recurring events are kept in windows after their first occurrence."""
+    once = {**normal_event_data, "uuid": "once", "recurrences": None}
+    weekly = {**normal_event_data, "uuid": "weekly"}
+    later = normal_event_data["end_at"] + 7 * 24 * 3600 * 1000
+
+    assert select_window([once, weekly], later, later + 1000) == [weekly]
+    assert select_window([once, weekly]) == [once, weekly]
+
+
+def test_disjoint_spans():
+    """Test a node whose center is in none of the spans."""
+    events = [
+        {"uuid": "first", "start_at": 0, "end_at": 1, "recurrences": None},
+        {"uuid": "second", "start_at": 2, "end_at": 3, "recurrences": None},
+    ]
+    index = EventIndex.from_dicts(events)
+    assert not index.root.starts
+    assert [view.event_data for view in index.overlapping(0, 3)] == events
+    assert [view.event_data for view in index.at(2)] == events[1:]
+    assert not index.at(1)
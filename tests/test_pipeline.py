@@ -0,0 +1,182 @@
+"""Tests for the pipeline module."""
+
+import gzip
+import io
+import os
+import threading
+
+import pytest
+from icalendar import Calendar
+
+from timetree_exporter import __version__, pipeline
+from timetree_exporter.pipeline import (
+    CALENDAR_FOOTER,
+    ICalStreamWriter,
+    convert_events,
+    export_events,
+    open_output,
+    pipelined,
+    serialize_events,
+    write_ical,
+)
+
+
+def test_pipelined_keeps_order():
+    """Test that items pass through a bounded queue in order."""
+    assert list(pipelined(range(100), maxsize=3)) == list(range(100))
+
+
+def test_pipelined_reraises():
+    """Test that an exception in a stage is raised to the consumer."""
+
+    def failing():
+        yield 1
+        raise ValueError("stage failed")
+
+    items = pipelined(failing())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="stage failed"):
+        next(items)
+
+
+def test_export_events_counts(normal_event_data, birthday_event_data, memo_event_data):
+    """Test that skipped events are counted but not serialized."""
+    counts = {}
+    serialized = list(
+        export_events([normal_event_data, birthday_event_data, memo_event_data], counts)
+    )
+    assert len(serialized) == 1
+    assert counts == {"read": 3, "converted": 1}
+    assert serialized[0][1] == {"Asia/Taipei"}
+
+
+def test_write_ical_matches_calendar(normal_event_data):
+    """Test that the written calendar is identical to Calendar.to_ical()."""
+    second_event_data = normal_event_data.copy()
+    second_event_data["uuid"] = "test-uuid-second"
+    second_event_data["end_timezone"] = "UTC"
+    ical_events = list(convert_events([normal_event_data, second_event_data]))
+
+    cal = Calendar()
+    cal.add("prodid", f"-//TimeTree Exporter {__version__}//EN")
+    cal.add("version", "2.0")
+    for ical_event in ical_events:
+        cal.add_component(ical_event)
+    cal.add_missing_timezones()
+
+    output = io.BytesIO()
+    assert write_ical(output, serialize_events(ical_events)) == 2
+    assert output.getvalue() == cal.to_ical()
+
+
+def test_stream_writer_writes_events_as_they_come(normal_event_data):
+    """Test that events reach the output before the calendar is complete."""
+    output = io.BytesIO()
+    serialized = export_events([normal_event_data])
+    with ICalStreamWriter(output) as writer:
+        assert output.getvalue().startswith(b"BEGIN:VCALENDAR\r\n")
+        assert writer.write_all(serialized) == 1
+        assert b"END:VEVENT\r\n" in output.getvalue()
+        assert b"BEGIN:VTIMEZONE" not in output.getvalue()
+    assert b"TZID:Asia/Taipei\r\n" in output.getvalue()
+    assert output.getvalue().endswith(CALENDAR_FOOTER)
+
+
+def test_stream_writer_concurrent_writes(normal_event_data):
+    """Test that events written from several threads are not interleaved."""
+    output = io.BytesIO()
+    ical_bytes, tzids = next(export_events([normal_event_data]))
+    with ICalStreamWriter(output) as writer:
+        threads = [
+            threading.Thread(
+                target=writer.write_all, args=([(ical_bytes, tzids)] * 50,)
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert writer.count == 200
+    assert len(Calendar.from_ical(output.getvalue()).events) == 200
+
+
+def test_stream_writer_leaves_interrupted_calendar_open():
+    """Test that a failed export does not look like a complete calendar."""
+    output = io.BytesIO()
+    with pytest.raises(ValueError):
+        with ICalStreamWriter(output):
+            raise ValueError("fetch failed")
+    assert not output.getvalue().endswith(CALENDAR_FOOTER)
+
+
+def test_open_output_gzip(tmp_path, normal_event_data):
+    """Test that outputs ending in .gz are compressed."""
+    path = str(tmp_path / "timetree.ics.gz")
+    with open_output(path) as f:
+        write_ical(f, export_events([normal_event_data]))
+    with gzip.open(path) as f:
+        cal = Calendar.from_ical(f.read())
+    assert len(cal.events) == 1
+
+
+def test_open_output_stdout(capsysbinary, normal_event_data):
+    """Test that "-" writes to the standard output."""
+    with open_output("-") as f:
+        write_ical(f, export_events([normal_event_data]))
+    assert capsysbinary.readouterr().out.endswith(CALENDAR_FOOTER)
+
+
+def without_dtstamp(serialized: list) -> list:
+    """Return the serialized events without their DTSTAMP lines."""
+    return [
+        (
+            b"".join(
+                line
+                for line in ical_bytes.splitlines(keepends=True)
+                if not line.startswith(b"DTSTAMP:")
+            ),
+            tzids,
+        )
+        for ical_bytes, tzids in serialized
+    ]
+
+
+@pytest.mark.parametrize("serializer", ["icalendar", "direct"])
+def test_export_events_jobs_keep_order(
+    monkeypatch, serializer, normal_event_data, birthday_event_data
+):
+    """Test that events serialized in worker processes keep their order."""
+    monkeypatch.setattr(pipeline, "JOB_BATCH_SIZE", 3)
+    events = []
+    for i in range(20):
+        event_data = (birthday_event_data if i % 4 == 0 else normal_event_data).copy()
+        event_data["uuid"] = f"test-uuid-{i}"
+        events.append(event_data)
+
+    counts = {}
+    expected = list(export_events(events, serializer=serializer))
+    serialized = list(export_events(events, counts, serializer=serializer, jobs=2))
+    assert without_dtstamp(serialized) == without_dtstamp(expected)
+    assert counts == {"read": 20, "converted": 15}
+
+
+@pytest.mark.parametrize("name", ["timetree.ics", "timetree.ics.gz"])
+def test_failed_export_keeps_output(tmp_path, normal_event_data, name):
+    """Test that a failing export leaves the existing output file untouched."""
+    path = str(tmp_path / name)
+    with open_output(path) as f:
+        write_ical(f, export_events([normal_event_data]))
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def failing():
+        yield normal_event_data
+        raise ValueError("fetch failed")
+
+    with pytest.raises(ValueError, match="fetch failed"):
+        with open_output(path) as f:
+            write_ical(f, export_events(failing()))
+    with open(path, "rb") as f:
+        assert f.read() == content
+    assert os.listdir(tmp_path) == [name]
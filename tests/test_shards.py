@@ -0,0 +1,147 @@
+"""Tests for the shards module."""
+
+import json
+import os
+
+import pytest
+from icalendar import Calendar
+
+from timetree_exporter.shards import (
+    ShardedOutput,
+    manifest_path,
+    shard_path,
+    start_date,
+)
+
+# 2023-12-31 16:30 UTC, already 2024-01-01 in Taipei
+NEW_YEAR_TAIPEI = 1704040200000
+# 2024-05-15 00:00 UTC
+MID_MAY = 1715731200000
+
+
+def make_event(normal_event_data, uuid: str, start_at: int) -> dict:
+    """Return a copy of the normal event starting at the timestamp."""
+    return {
+        **normal_event_data,
+        "uuid": uuid,
+        "start_at": start_at,
+        "end_at": start_at + 3600000,
+    }
+
+
+def export(output: str, events: list, shard_by: str, **kwargs) -> ShardedOutput:
+    """Write the events of a calendar to a sharded output."""
+    with ShardedOutput(output, shard_by, **kwargs) as shards:
+        shards.write_all(
+            events,
+            {"alias_code": "code"},
+            serializer=kwargs.get("serializer", "icalendar"),
+        )
+    return shards
+
+
+def read_manifest(output: str) -> dict:
+    """Return the manifest of a sharded output."""
+    with open(manifest_path(output), encoding="UTF-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def uids(path: str) -> list:
+    """Return the UIDs of the events of an iCal file."""
+    with open(path, "rb") as f:
+        return [str(event["uid"]) for event in Calendar.from_ical(f.read()).events]
+
+
+def test_shard_paths():
+    """Test that shards and the manifest are named after the output."""
+    assert shard_path("out/timetree.ics", "2024") == "out/timetree_2024.ics"
+    assert shard_path("timetree.ics.gz", "2024-05") == "timetree_2024-05.ics.gz"
+    assert shard_path("timetree", "code") == "timetree_code.ics"
+    assert manifest_path("out/timetree.ics.gz") == "out/timetree.manifest.json"
+
+
+def test_start_date_in_start_timezone(normal_event_data):
+    """Test that events are bucketed by their local start date."""
+    event = make_event(normal_event_data, "uuid", NEW_YEAR_TAIPEI)
+    assert start_date(event).isoformat() == "2024-01-01"
+    event["start_timezone"] = "UTC"
+    assert start_date(event).isoformat() == "2023-12-31"
+
+
+@pytest.mark.parametrize("serializer", ["icalendar", "direct"])
+def test_shard_by_month(tmp_path, normal_event_data, serializer):
+    """Test that each month is a complete calendar with its own events."""
+    output = str(tmp_path / "timetree.ics")
+    events = [
+        make_event(normal_event_data, "new-year", NEW_YEAR_TAIPEI),
+        make_event(normal_event_data, "may-1", MID_MAY),
+        make_event(normal_event_data, "may-2", MID_MAY + 86400000),
+    ]
+    export(output, events, "month", serializer=serializer)
+
+    manifest = read_manifest(output)
+    assert manifest["shard_by"] == "month"
+    assert [(shard["key"], shard["events"]) for shard in manifest["shards"]] == [
+        ("2024-01", 1),
+        ("2024-05", 2),
+    ]
+    assert uids(shard_path(output, "2024-05")) == ["may-1", "may-2"]
+    with open(shard_path(output, "2024-01"), "rb") as f:
+        assert b"TZID:Asia/Taipei\r\n" in f.read()
+
+
+def test_shard_by_calendar(tmp_path, normal_event_data):
+    """Test that the events of a calendar go to the shard of the calendar."""
+    output = str(tmp_path / "timetree.ics")
+    events = [make_event(normal_event_data, "uuid", MID_MAY)]
+    export(output, events, "calendar")
+    assert uids(shard_path(output, "code")) == ["uuid"]
+
+
+def test_update_touches_affected_shards(tmp_path, normal_event_data):
+    """Test that updating rewrites changed shards and removes empty ones."""
+    output = str(tmp_path / "timetree.ics")
+    events = [
+        make_event(normal_event_data, "new-year", NEW_YEAR_TAIPEI),
+        make_event(normal_event_data, "may", MID_MAY),
+        make_event(normal_event_data, "next-year", MID_MAY + 365 * 86400000),
+    ]
+    export(output, events, "year", update=True)
+    mtimes = {
+        key: os.stat(shard_path(output, key)).st_mtime_ns for key in ("2024", "2025")
+    }
+
+    events[0] = {**events[0], "title": "Changed"}
+    del events[2]
+    export(output, events, "year", update=True)
+
+    assert os.stat(shard_path(output, "2024")).st_mtime_ns != mtimes["2024"]
+    assert not os.path.exists(shard_path(output, "2025"))
+    assert [shard["key"] for shard in read_manifest(output)["shards"]] == ["2024"]
+
+    # Nothing changed, the shard is left untouched
+    mtime = os.stat(shard_path(output, "2024")).st_mtime_ns
+    export(output, events, "year", update=True)
+    assert os.stat(shard_path(output, "2024")).st_mtime_ns == mtime
+
+
+def test_failed_export_keeps_shards(tmp_path, normal_event_data):
+    """Test that a failing export leaves the existing shards untouched."""
+    output = str(tmp_path / "timetree.ics")
+    events = [make_event(normal_event_data, "may", MID_MAY)]
+    export(output, events, "year")
+    files = {}
+    for name in os.listdir(tmp_path):
+        with open(tmp_path / name, "rb") as f:
+            files[name] = f.read()
+
+    def failing():
+        yield make_event(normal_event_data, "may", MID_MAY)
+        raise ValueError("fetch failed")
+
+    with pytest.raises(ValueError, match="fetch failed"):
+        export(output, failing(), "year")
+    assert sorted(os.listdir(tmp_path)) == sorted(files)
+    for name, content in files.items():
+        with open(tmp_path / name, "rb") as f:
+            assert f.read() == content
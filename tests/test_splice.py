@@ -0,0 +1,157 @@
+"""Tests for the splice module."""
+
+import os
+import threading
+
+import pytest
+from icalendar import Calendar
+
+from timetree_exporter.splice import IncrementalOutput, index_path
+
+
+def make_events(normal_event_data, count: int) -> list:
+    """Return copies of the normal event with distinct uuids and titles."""
+    events = []
+    for i in range(count):
+        event_data = normal_event_data.copy()
+        event_data["uuid"] = f"test-uuid-{i}"
+        event_data["title"] = f"Event {i}"
+        events.append(event_data)
+    return events
+
+
+def export(path: str, events: list, serializer: str = "direct", jobs: int = 1) -> dict:
+    """Update the output with the events and return the counts."""
+    counts = {}
+    with IncrementalOutput(path, serializer) as output:
+        output.write_all(events, counts, serializer=serializer, jobs=jobs)
+    return counts
+
+
+def vevents(path: str) -> dict:
+    """Return the VEVENT bytes of an output file by UID."""
+    with open(path, "rb") as f:
+        chunks = f.read().split(b"BEGIN:VEVENT\r\n")[1:]
+    chunks = [chunk.split(b"END:VEVENT\r\n")[0] for chunk in chunks]
+    return {
+        chunk.split(b"UID:")[1].split(b"\r\n")[0].decode(): chunk for chunk in chunks
+    }
+
+
+def test_first_export_writes_index(tmp_path, normal_event_data):
+    """Test that a first export renders every event and writes the index."""
+    path = str(tmp_path / "timetree.ics")
+    counts = export(path, make_events(normal_event_data, 5))
+    assert counts["spliced"] == 0
+    assert counts["converted"] == 5
+    assert os.path.exists(index_path(path))
+    with open(path, "rb") as f:
+        cal = Calendar.from_ical(f.read())
+    assert [str(event["uid"]) for event in cal.events] == [
+        f"test-uuid-{i}" for i in range(5)
+    ]
+
+
+def test_unchanged_output_is_not_rewritten(tmp_path, normal_event_data):
+    """Test that the output is left untouched when no event has changed."""
+    path = str(tmp_path / "timetree.ics")
+    events = make_events(normal_event_data, 5)
+    export(path, events)
+    mtime = os.stat(path).st_mtime_ns
+
+    counts = export(path, events)
+    assert counts["spliced"] == 5
+    assert counts["converted"] == 0
+    assert os.stat(path).st_mtime_ns == mtime
+    assert sorted(os.listdir(tmp_path)) == ["timetree.ics", "timetree.ics.index.json"]
+
+
+@pytest.mark.parametrize("serializer", ["icalendar", "direct"])
+def test_changed_events_are_spliced(tmp_path, normal_event_data, serializer):
+    """Test that only changed events are rendered, the others are copied."""
+    path = str(tmp_path / "timetree.ics")
+    events = make_events(normal_event_data, 5)
+    export(path, events, serializer)
+    before = vevents(path)
+
+    events[1] = {**events[1], "title": "Renamed", "updated_at": 1713110200000}
+    del events[3]
+    events.append({**normal_event_data, "uuid": "test-uuid-new"})
+    counts = export(path, events, serializer)
+
+    assert counts["spliced"] == 3
+    assert counts["converted"] == 2
+    after = vevents(path)
+    assert list(after) == [event["uuid"] for event in events]
+    for uid in ("test-uuid-0", "test-uuid-2", "test-uuid-4"):
+        assert after[uid] == before[uid]
+    assert b"SUMMARY:Renamed" in after["test-uuid-1"]
+    with open(path, "rb") as f:
+        assert len(Calendar.from_ical(f.read()).events) == 5
+
+    # The new index locates the spliced and rendered events
+    assert export(path, events, serializer)["spliced"] == 5
+
+
+@pytest.mark.parametrize(
+    "serializer, jobs",
+    [("icalendar", 1), ("direct", 1), ("icalendar", 2), ("direct", 2)],
+)
+def test_sparse_changes_are_rendered(tmp_path, normal_event_data, serializer, jobs):
+    """
+    Test that a few changed events among many unchanged ones are rendered
+    without waiting for the batches of the rendering stage to fill up.
+    """
+
+    def export_in_time() -> dict:
+        result = {}
+        thread = threading.Thread(
+            target=lambda: result.update(export(path, events, serializer, jobs)),
+            daemon=True,
+        )
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive(), "the export is deadlocked"
+        return result
+
+    path = str(tmp_path / "timetree.ics")
+    events = make_events(normal_event_data, 2500)
+    assert export_in_time()["converted"] == 2500
+    for i in (0, 1200, 2499):
+        events[i] = {**events[i], "title": "Renamed"}
+
+    result = export_in_time()
+    assert result["spliced"] == 2497
+    assert result["converted"] == 3
+    after = vevents(path)
+    assert list(after) == [event["uuid"] for event in events]
+    assert b"SUMMARY:Renamed" in after["test-uuid-1200"]
+
+
+def test_modified_output_is_rendered_again(tmp_path, normal_event_data):
+    """Test that an index not matching the output file is ignored."""
+    path = str(tmp_path / "timetree.ics")
+    events = make_events(normal_event_data, 3)
+    export(path, events)
+    with open(path, "ab") as f:
+        f.write(b"\r\n")
+    assert export(path, events)["spliced"] == 0
+
+
+def test_failed_export_keeps_output(tmp_path, normal_event_data):
+    """Test that an interrupted export leaves the previous output in place."""
+    path = str(tmp_path / "timetree.ics")
+    events = make_events(normal_event_data, 3)
+    export(path, events)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def failing():
+        yield events[0]
+        raise ValueError("fetch failed")
+
+    with pytest.raises(ValueError, match="fetch failed"):
+        export(path, failing())
+    with open(path, "rb") as f:
+        assert f.read() == content
+    assert sorted(os.listdir(tmp_path)) == ["timetree.ics", "timetree.ics.index.json"]
@@ -0,0 +1,248 @@
+"""Tests for the state module."""
+
+import os
+
+from timetree_exporter.__main__ import get_events
+from timetree_exporter.api.calendar import SyncChunk
+from timetree_exporter.api.calendar import TimeTreeCalendar
+from timetree_exporter.merge import EventMerge, iter_live_events, merge_events
+from timetree_exporter.state import (
+    ChunkCheckpoint,
+    SyncState,
+    SyncStateStore,
+    sync_events,
+)
+
+
+class FakeCalendar:
+    """Calendar stub returning predefined sync chunks."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.requested_since = []
+
+    def iter_event_chunks(
+        self, calendar_id, calendar_name=None, since=None, checkpoint=None
+    ):
+        """Yield the predefined chunks."""
+        # pylint: disable=unused-argument
+        self.requested_since.append(since)
+        yield from self.chunks
+
+
+def test_store_roundtrip(tmp_path):
+    """Test saving and loading the sync state."""
+    store = SyncStateStore(str(tmp_path))
+    assert store.load(1) is None
+
+    store.save(1, SyncState(since=100, events=[{"uuid": "a", "title": "活動"}]))
+    state = store.load(1)
+    assert state.since == 100
+    assert state.events == [{"uuid": "a", "title": "活動"}]
+
+    store.clear(1)
+    assert store.load(1) is None
+
+
+def test_merge_events():
+    """Test that updated events replace the old ones and new ones are appended."""
+    events = [{"uuid": "a", "title": "A"}, {"uuid": "b", "title": "B"}]
+    delta = [{"uuid": "b", "title": "B2"}, {"uuid": "c", "title": "C"}]
+
+    merged = merge_events(events, delta)
+    assert [event["title"] for event in merged] == ["A", "B2", "C"]
+
+
+def test_merge_keeps_newest_and_tombstones():
+    """Test that stale versions are ignored and deleted events stay deleted."""
+    merge = EventMerge(
+        [{"uuid": "a", "title": "A", "updated_at": 20}, {"uuid": "b", "updated_at": 5}]
+    )
+    changed = merge.apply(
+        [
+            {"uuid": "a", "title": "A0", "updated_at": 10},
+            {"uuid": "b", "updated_at": 30, "deactivated_at": 30},
+            {"uuid": "b", "updated_at": 15},
+            {"uuid": "a", "title": "A2", "updated_at": 20},
+        ]
+    )
+    assert changed == 2
+    assert merge.to_list() == [{"uuid": "a", "title": "A2", "updated_at": 20}]
+    assert merge.tombstones == {"b": 30}
+
+    merge.apply([{"uuid": "b", "updated_at": 40}])
+    assert [event["uuid"] for event in merge.to_list()] == ["a", "b"]
+    assert not merge.tombstones
+
+
+def test_iter_live_events():
+    """
+    Test that streamed events are deduplicated and deleted ones dropped.
+    The version seen first is kept, even if a newer one follows.
+    """
+    events = iter_live_events(
+        [
+            {"uuid": "a", "updated_at": 1},
+            {"uuid": "b", "updated_at": 5, "deactivated_at": 5},
+            {"uuid": "b", "updated_at": 3},
+            {"uuid": "a", "updated_at": 2},
+            {"uuid": "c", "updated_at": 1, "deactivated_at": 1},
+            {"uuid": "c", "updated_at": 2},
+        ]
+    )
+    assert list(events) == [
+        {"uuid": "a", "updated_at": 1},
+        {"uuid": "c", "updated_at": 2},
+    ]
+
+
+def test_sync_events_persists_tombstones(tmp_path):
+    """Test that deletions are stored with the sync state."""
+    store = SyncStateStore(str(tmp_path))
+    store.save(1, SyncState(since=10, events=[{"uuid": "a", "updated_at": 1}]))
+    calendar = FakeCalendar(
+        [
+            SyncChunk(
+                events=[{"uuid": "a", "updated_at": 2, "deactivated_at": 2}],
+                since=20,
+                chunk=False,
+            )
+        ]
+    )
+
+    assert not sync_events(calendar, 1, store)
+    assert store.load(1).tombstones == {"a": 2}
+
+
+def test_sync_events_uses_saved_cursor(tmp_path):
+    """Test that a second sync resumes from the saved cursor."""
+    store = SyncStateStore(str(tmp_path))
+    first = FakeCalendar(
+        [
+            SyncChunk(events=[{"uuid": "a", "title": "A"}], since=10, chunk=True),
+            SyncChunk(events=[{"uuid": "b", "title": "B"}], since=20, chunk=False),
+        ]
+    )
+    events = sync_events(first, 1, store)
+    assert first.requested_since == [None]
+    assert [event["uuid"] for event in events] == ["a", "b"]
+
+    second = FakeCalendar(
+        [SyncChunk(events=[{"uuid": "a", "title": "A2"}], since=30, chunk=False)]
+    )
+    events = sync_events(second, 1, store)
+    assert second.requested_since == [20]
+    assert [event["title"] for event in events] == ["A2", "B"]
+    assert store.load(1).since == 30
+
+
+def test_checkpoint_resumes_from_last_chunk(tmp_path):
+    """Test that an interrupted fetch resumes after the last saved chunk."""
+    chunks = {
+        None: SyncChunk(events=[{"uuid": "a"}], since=10, chunk=True),
+        10: SyncChunk(events=[{"uuid": "b"}], since=20, chunk=True),
+        20: SyncChunk(events=[{"uuid": "c"}], since=30, chunk=False),
+    }
+    fetched = []
+
+    def fetch_chunk(calendar_id, calendar_name=None, since=None):
+        # pylint: disable=unused-argument
+        fetched.append(since)
+        if since == 20 and len(fetched) == 3:
+            raise ConnectionError("interrupted")
+        return chunks[since]
+
+    calendar = TimeTreeCalendar("session-id")
+    calendar.fetch_chunk = fetch_chunk
+
+    checkpoint = ChunkCheckpoint(1, cache_dir=str(tmp_path))
+    events = []
+    try:
+        for event in calendar.iter_events(1, checkpoint=checkpoint):
+            events.append(event["uuid"])
+    except ConnectionError:
+        pass
+    assert events == ["a", "b"]
+
+    checkpoint = ChunkCheckpoint(1, cache_dir=str(tmp_path))
+    events = [event["uuid"] for event in calendar.iter_events(1, checkpoint=checkpoint)]
+    assert events == ["a", "b", "c"]
+    assert fetched == [None, 10, 20, 20]
+
+    # The checkpoint is cleared once the fetch has completed
+    assert not ChunkCheckpoint(1, cache_dir=str(tmp_path)).load()
+
+
+def test_checkpoint_keeps_newest_version(tmp_path):
+    """Test that events fetched after the saved chunks replace their versions."""
+    chunks = {
+        None: SyncChunk(events=[{"uuid": "a", "updated_at": 1}], since=10, chunk=True),
+        10: SyncChunk(events=[{"uuid": "a", "updated_at": 2}], since=20, chunk=False),
+    }
+    fetched = []
+
+    def fetch_chunk(calendar_id, calendar_name=None, since=None):
+        # pylint: disable=unused-argument
+        fetched.append(since)
+        if since == 10 and len(fetched) == 2:
+            raise ConnectionError("interrupted")
+        return chunks[since]
+
+    calendar = TimeTreeCalendar("session-id")
+    calendar.fetch_chunk = fetch_chunk
+    metadata = {"id": 1, "name": "Calendar"}
+    try:
+        list(get_events(calendar, metadata, cache_dir=str(tmp_path), checkpoint=True))
+    except ConnectionError:
+        pass
+
+    events = get_events(calendar, metadata, cache_dir=str(tmp_path), checkpoint=True)
+    assert fetched == [None, 10, 10]
+    assert events == [{"uuid": "a", "updated_at": 2}]
+
+
+def test_sync_appends_delta_to_log(tmp_path, monkeypatch):
+    """Test that a sync appends its delta instead of rewriting the snapshot."""
+    store = SyncStateStore(str(tmp_path))
+    events = [{"uuid": str(i), "title": "Event", "updated_at": 1} for i in range(50)]
+    sync_events(
+        FakeCalendar([SyncChunk(events=events, since=10, chunk=False)]), 1, store
+    )
+    snapshot = os.stat(store.path(1)).st_mtime_ns
+
+    delta = [{"uuid": "3", "updated_at": 2, "deactivated_at": 2}, {"uuid": "new"}]
+    sync_events(
+        FakeCalendar([SyncChunk(events=delta, since=20, chunk=False)]), 1, store
+    )
+    assert os.stat(store.path(1)).st_mtime_ns == snapshot
+    assert os.path.exists(store.log_path(1))
+
+    state = store.load(1)
+    assert state.since == 20
+    assert len(state.events) == 50
+    assert state.events[-1] == {"uuid": "new"}
+    assert state.tombstones == {"3": 2}
+
+    # Once the log is large enough, it is compacted into a new snapshot
+    monkeypatch.setattr("timetree_exporter.state.COMPACT_RATIO", 0)
+    sync_events(FakeCalendar([SyncChunk(events=[], since=30, chunk=False)]), 1, store)
+    assert not os.path.exists(store.log_path(1))
+    assert store.load(1) == SyncState(
+        since=30, events=state.events, tombstones=state.tombstones
+    )
+
+
+def test_stale_log_is_ignored(tmp_path):
+    """Test that deltas already compacted into the snapshot are not replayed."""
+    store = SyncStateStore(str(tmp_path))
+    store.save(1, SyncState(since=20, events=[{"uuid": "a", "title": "A2"}]))
+    with open(store.log_path(1), "w", encoding="UTF-8") as log_file:
+        log_file.write('{"from": 10, "since": 20, "events": [{"uuid": "b"}]}\n')
+        log_file.write('{"from": 20, "since": 30, "events": [{"uuid": "c"}]}\n')
+        log_file.write('{"from": 30, "since": 40, "eve')
+
+    state = store.load(1)
+    assert state.since == 30
+    assert [event["uuid"] for event in state.events] == ["a", "c"]
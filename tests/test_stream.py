@@ -0,0 +1,45 @@
+"""Tests for the stream module."""
+
+import json
+
+import pytest
+
+from timetree_exporter.api.stream import iter_json_array
+
+
+def split(data: bytes, size: int) -> list:
+    """Split data into pieces of the given size."""
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_json_array_any_piece_size():
+    """Test decoding a sync response split at arbitrary byte boundaries."""
+    body = {
+        "chunk": True,
+        "events": [
+            {"uuid": "a", "title": "測試活動", "alerts": [15, 60], "all_day": False},
+            {"uuid": "b", "title": 'Event "B" \\ \u00e9', "location_lat": None},
+        ],
+        "since": 1713110000000,
+    }
+    data = json.dumps(body, ensure_ascii=False, indent=1).encode("UTF-8")
+
+    for size in range(1, 40):
+        fields = {}
+        events = list(iter_json_array(split(data, size), "events", fields))
+        assert events == body["events"]
+        assert fields == {"chunk": True, "since": 1713110000000}
+
+
+def test_iter_json_array_empty():
+    """Test decoding responses without events."""
+    fields = {}
+    assert not list(iter_json_array([b'{"events": [], "since": 1}'], "events", fields))
+    assert fields == {"since": 1}
+    assert not list(iter_json_array([b"{}"], "events"))
+
+
+def test_iter_json_array_truncated():
+    """Test that a truncated body is reported as an error."""
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array([b'{"events": [{"uuid": "a"}, {"uu'], "events"))
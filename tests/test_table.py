@@ -0,0 +1,66 @@
+"""Tests for the table module."""
+
+from timetree_exporter.event import TimeTreeEvent
+from timetree_exporter.formatter import ICalEventFormatter
+from timetree_exporter.table import TimeTreeEventTable, TimeTreeEventRow
+
+
+def test_table_roundtrip(normal_event_data, birthday_event_data):
+    """Test that the rows of a table have the values of the events."""
+    table = TimeTreeEventTable.from_dicts([normal_event_data, birthday_event_data])
+
+    assert len(table) == 2
+    assert isinstance(table[0], TimeTreeEventRow)
+    for row, event_data in zip(table, [normal_event_data, birthday_event_data]):
+        event = TimeTreeEvent.from_dict(event_data)
+        for attribute in TimeTreeEvent.__slots__:
+            assert getattr(row, attribute) == getattr(event, attribute)
+    assert table.row(1).location_lat is None
+    assert table.row(-1).all_day is True
+    assert table.column("start_timezone") == ["Asia/Taipei", "Asia/Taipei"]
+    assert table.timezone_names == ["Asia/Taipei"]
+
+
+def test_table_filter_and_slice(normal_event_data, birthday_event_data):
+    """Test selecting rows with masks and slices."""
+    events = []
+    for index in range(10):
+        source = normal_event_data if index % 2 else birthday_event_data
+        events.append({**source, "uuid": f"uuid-{index}", "start_at": 1000 * index})
+    table = TimeTreeEventTable.from_dicts(events)
+
+    window = table.filter(table.between("start_at", 3000, 7000))
+    assert window.column("uuid") == ["uuid-3", "uuid-4", "uuid-5", "uuid-6"]
+    all_day = table.filter(table.equals("all_day", True))
+    assert all_day.column("uuid") == [f"uuid-{index}" for index in range(0, 10, 2)]
+    assert table[2:5].column("uuid") == ["uuid-2", "uuid-3", "uuid-4"]
+    assert table[::3].column("start_at") == [0, 3000, 6000, 9000]
+    assert table[2:5].row(1).note == normal_event_data["note"]
+
+
+def test_large_small_int_values(normal_event_data):
+    """Test that values beyond the int16 range widen the column."""
+    events = [
+        {**normal_event_data, "uuid": "none", "category": None},
+        {**normal_event_data, "uuid": "large", "category": 40000},
+        {**normal_event_data, "uuid": "negative", "category": -(2**15)},
+    ]
+    table = TimeTreeEventTable.from_dicts(events)
+
+    assert table.column("category") == [None, 40000, -(2**15)]
+    assert table.row(1).category == 40000
+    assert table.filter(table.equals("category", 40000)).column("uuid") == ["large"]
+    assert table[1:].column("category") == [40000, -(2**15)]
+
+
+def test_row_formatting(normal_event_data):
+    """Test that a row is formatted like the TimeTreeEvent it was built from."""
+    table = TimeTreeEventTable.from_dicts([normal_event_data])
+    from_row = ICalEventFormatter(table[0]).to_ical()
+    from_event = ICalEventFormatter(
+        TimeTreeEvent.from_dict(normal_event_data)
+    ).to_ical()
+    del from_row["dtstamp"]
+    del from_event["dtstamp"]
+
+    assert from_row.to_ical() == from_event.to_ical()
@@ -0,0 +1,136 @@
+"""Tests for the tz module."""
+
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from icalendar import Timezone
+
+from timetree_exporter import tz
+from timetree_exporter.tz import (
+    TimezoneRegistry,
+    VTimezoneCache,
+    format_local_datetime,
+    format_local_datetimes,
+    offset_at,
+)
+from timetree_exporter.utils import convert_timestamp_to_datetime
+
+HOUR = 3600 * 1000
+
+
+def test_offset_table_transitions():
+    """Test that the table has the offsets of zoneinfo around DST changes."""
+    registry = TimezoneRegistry()
+    table = registry.table("Europe/Berlin")
+    # 2024-03-31 01:00 UTC, the start of the summer time
+    change = int(datetime(2024, 3, 31, 1, tzinfo=timezone.utc).timestamp()) * 1000
+
+    assert change in table.transitions
+    assert table.offset(change - 1) == HOUR
+    assert table.offset(change) == 2 * HOUR
+    for timestamp in range(change - 48 * HOUR, change + 48 * HOUR, HOUR // 2):
+        assert table.offset(timestamp) == offset_at(table.zone, timestamp)
+
+
+def test_registry_outside_span():
+    """Test that timestamps outside the precomputed span are still converted."""
+    registry = TimezoneRegistry()
+    registry.set_span(0, 365 * 24 * HOUR)
+    # 1969-07-01 and 2024-07-01, both in daylight saving time in New York
+    for year in (1969, 2024):
+        moment = datetime(year, 7, 1, 12, tzinfo=ZoneInfo("America/New_York"))
+        timestamp = int(moment.timestamp()) * 1000
+        local = registry.local(timestamp, "America/New_York")
+        assert format_local_datetime(local) == f"{year}0701T120000"
+        assert registry.to_datetime(timestamp, "America/New_York") == moment
+    assert registry.zone("Asia/Tokyo") is registry.zone("Asia/Tokyo")
+
+
+def test_to_datetime_matches_zoneinfo():
+    """Test that datetimes keep the milliseconds and the fold of repeated times."""
+    registry = TimezoneRegistry()
+    # 2024-10-27 01:00 UTC, the end of the summer time in Berlin
+    change = int(datetime(2024, 10, 27, 1, tzinfo=timezone.utc).timestamp()) * 1000
+    timestamps = list(range(change - 2 * HOUR, change + 2 * HOUR, HOUR // 4))
+    timestamps += [change - HOUR // 2 + 123, -(10**12) + 456]
+    zone = ZoneInfo("Europe/Berlin")
+    for timestamp in timestamps:
+        expected = (
+            datetime(1970, 1, 1, tzinfo=timezone.utc)
+            + timedelta(milliseconds=timestamp)
+        ).astimezone(zone)
+        converted = registry.to_datetime(timestamp, "Europe/Berlin")
+        assert converted == expected
+        assert (converted.isoformat(), converted.fold) == (
+            expected.isoformat(),
+            expected.fold,
+        )
+    # 02:30 again, after the clocks went back
+    assert registry.to_datetime(change + HOUR // 2, "Europe/Berlin").fold == 1
+
+
+def test_convert_negative_timestamp_offset():
+    """Test that timestamps before 1970 use the offset in effect at the time."""
+    moment = datetime(1969, 7, 1, 12, tzinfo=ZoneInfo("America/New_York"))
+    converted = convert_timestamp_to_datetime(
+        moment.timestamp(), ZoneInfo("America/New_York")
+    )
+    assert converted == moment
+    assert converted.hour == 12
+
+
+def test_batch_conversion_matches_single_values():
+    """Test converting mixed, unsorted timestamps and timezones in one batch."""
+    rng = random.Random(0)
+    names = ["Asia/Tokyo", "Europe/Berlin", "America/New_York", "UTC"]
+    timestamps = [rng.randrange(-(10**12), 3 * 10**12) for _ in range(2000)]
+    timezones = [rng.choice(names) for _ in timestamps]
+    registry = TimezoneRegistry()
+
+    local_times = registry.localize(timestamps, timezones)
+    expected = [
+        convert_timestamp_to_datetime(timestamp / 1000, ZoneInfo(name)).strftime(
+            "%Y%m%dT%H%M%S"
+        )
+        for timestamp, name in zip(timestamps, timezones)
+    ]
+    assert format_local_datetimes(local_times) == expected
+    assert list(registry.localize(sorted(timestamps), ["UTC"] * 2000)) == sorted(
+        timestamps
+    )
+
+
+def test_vtimezone_cache(tmp_path, monkeypatch):
+    """Test that VTIMEZONE components are generated once and reused by later runs."""
+    monkeypatch.setattr(tz, "tzdata_version", lambda: "2024a")
+    cache = VTimezoneCache()
+    cache.set_cache_dir(str(tmp_path))
+    expected = Timezone.from_tzid("Europe/Berlin").to_ical()
+    assert cache.to_ical(["Europe/Berlin", "Not/AZone"]) == expected
+    assert len(list((tmp_path / "timezones").iterdir())) == 1
+
+    def from_tzid(*args, **kwargs):
+        raise AssertionError("VTIMEZONE generated again")
+
+    # A new run reads the component from the disk
+    monkeypatch.setattr(Timezone, "from_tzid", from_tzid)
+    cache = VTimezoneCache()
+    cache.set_cache_dir(str(tmp_path))
+    assert cache.get("Europe/Berlin") == expected
+
+    # A tzdata update invalidates the cached components
+    monkeypatch.setattr(tz, "tzdata_version", lambda: "2024b")
+    cache = VTimezoneCache()
+    cache.set_cache_dir(str(tmp_path))
+    with pytest.raises(AssertionError, match="generated again"):
+        cache.get("Europe/Berlin")
+
+    # So does an icalendar update
+    monkeypatch.setattr(tz, "tzdata_version", lambda: "2024a")
+    monkeypatch.setattr(tz.icalendar, "__version__", "0.0.0")
+    cache = VTimezoneCache()
+    cache.set_cache_dir(str(tmp_path))
+    with pytest.raises(AssertionError, match="generated again"):
+        cache.get("Europe/Berlin")
@@ -6,7 +6,9 @@ from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from timetree_exporter.utils import (
+    FLUSH,
     get_events_from_file,
+    iter_batches,
     paths_to_filelist,
     convert_timestamp_to_datetime,
 )
@@ -137,3 +139,9 @@ def test_convert_timestamp_to_datetime():
     assert tokyo_dt.month == 1
     assert tokyo_dt.day == 1
     assert tokyo_dt.hour == 9  # 東京比UTC快9小時
+
+
+def test_iter_batches_flush():
+    """Test that a FLUSH marker ends the current batch early."""
+    items = [1, 2, 3, FLUSH, 4, FLUSH, FLUSH, 5, 6, 7, 8]
+    assert list(iter_batches(items, 3)) == [[1, 2, 3], [], [4], [], [5, 6, 7], [8]]
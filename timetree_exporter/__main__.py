@@ -3,24 +3,50 @@ This module login in to TimeTree and converts Timetree events to iCal format.
 """
 
 import argparse
+import contextlib
 import logging
 import os
-from importlib.metadata import version
-from icalendar import Calendar
-from timetree_exporter import TimeTreeEvent, ICalEventFormatter, __version__
-from timetree_exporter.api.auth import login
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from timetree_exporter import __version__
+from timetree_exporter.api.auth import SessionCache, login
+from timetree_exporter.api.cache import ResponseCache
 from timetree_exporter.api.calendar import TimeTreeCalendar
-from timetree_exporter.utils import safe_getpass
+from timetree_exporter.filters import (
+    EventFilter,
+    filter_events,
+    parse_label,
+    parse_window_bound,
+)
+from timetree_exporter.formatter import parse_recurrence_parts
+from timetree_exporter.merge import iter_live_events, merge_events
+from timetree_exporter.pipeline import (
+    ICalStreamWriter,
+    export_events,
+    open_output,
+    process_pool,
+    write_ical,
+)
+from timetree_exporter.shards import (
+    SHARD_BY,
+    ShardedOutput,
+    manifest_path,
+    shard_path,
+)
+from timetree_exporter.splice import IncrementalOutput, can_update
+from timetree_exporter.state import ChunkCheckpoint, SyncStateStore, sync_events
+from timetree_exporter.tz import registry, vtimezones
+from timetree_exporter.utils import get_cache_dir, safe_getpass
 
 logger = logging.getLogger(__name__)
 package_logger = logging.getLogger(__package__)
 
 
-def get_events(email: str, password: str, calendar_code: str):
-    """Get events from the Timetree API."""
-    use_code = bool(calendar_code)
-    session_id = login(email, password)
-    calendar = TimeTreeCalendar(session_id)
+def select_calendars(
+    calendar: TimeTreeCalendar, calendar_codes: list, select_all: bool = False
+) -> list:
+    """Select the calendars to export, prompting the user if needed."""
     metadatas = calendar.get_metadata()
 
     # Filter out deactivated calendars
@@ -32,48 +58,255 @@ def get_events(email: str, password: str, calendar_code: str):
         logger.error("No active calendars found")
         raise ValueError
 
-    if calendar_code:
+    if select_all:
+        return metadatas
+
+    if calendar_codes:
         # Filter calendars by code
         filtered_metadatas = [
             metadata
             for metadata in metadatas
-            if metadata["alias_code"] == calendar_code
+            if metadata["alias_code"] in calendar_codes
         ]
 
         if len(filtered_metadatas) == 0:
             logger.error("No calendars found with the specified codes")
-            use_code = False
         else:
-            metadata = filtered_metadatas[0]
-            print(
-                f"Using calendar: {metadata['name']} (code: {metadata['alias_code']})"
-            )
-            use_code = True
-
-    if not use_code:
-        # Print out the list of calendars for the user to choose from
-        for i, metadata in enumerate(metadatas):
-            print(
-                f"{i+1}. {metadata['name'] if metadata['name'] else 'Unnamed'} "
-                f"(code: {metadata['alias_code']})"
-            )
+            for metadata in filtered_metadatas:
+                print(
+                    f"Using calendar: {metadata['name']} "
+                    f"(code: {metadata['alias_code']})"
+                )
+            return filtered_metadatas
 
-        # Ask the user to choose a calendar
-        calendar_num = (
-            input("Which Calendar(s) do you want to export? (Default to 1): ") or "1"
+    # Print out the list of calendars for the user to choose from
+    for i, metadata in enumerate(metadatas):
+        print(
+            f"{i+1}. {metadata['name'] if metadata['name'] else 'Unnamed'} "
+            f"(code: {metadata['alias_code']})"
         )
+
+    # Ask the user to choose one or more calendars, e.g. "1" or "1,3"
+    calendar_nums = (
+        input("Which Calendar(s) do you want to export? (Default to 1): ") or "1"
+    ).split(",")
+    selected = []
+    for calendar_num in calendar_nums:
+        calendar_num = calendar_num.strip()
         if not calendar_num.isdigit() or not 1 <= int(calendar_num) <= len(metadatas):
             raise ValueError(
                 f"Invalid Calendar Number. Must be a number between 1 and {len(metadatas)}"
             )
-        idx = int(calendar_num) - 1
-        metadata = metadatas[idx]
+        selected.append(metadatas[int(calendar_num) - 1])
+    return selected
+
+
+def get_events(
+    calendar: TimeTreeCalendar,
+    metadata: dict,
+    incremental: bool = False,
+    cache_dir: str = None,
+    checkpoint: bool = False,
+):
+    """Get events of a calendar from the Timetree API.
+
+    Events are yielded chunk by chunk as they are downloaded. In incremental mode
+    only the changes since the previous run are downloaded and merged into the
+    locally stored events. With checkpointing, fetched chunks are saved so that
+    an interrupted export resumes from the last completed chunk, and the events
+    are merged once the whole calendar has been fetched.
+    """
+    if incremental:
+        return sync_events(
+            calendar,
+            metadata["id"],
+            SyncStateStore(cache_dir),
+            metadata["name"],
+            checkpoint=checkpoint,
+        )
+    if checkpoint:
+        # The saved chunks come first and may hold older versions of events
+        # fetched again since, so the newest versions are merged in memory
+        return merge_events(
+            calendar.iter_events(
+                metadata["id"],
+                metadata["name"],
+                checkpoint=ChunkCheckpoint(metadata["id"], cache_dir=cache_dir),
+            )
+        )
+    # Duplicated and deleted events are dropped without buffering the calendar
+    return iter_live_events(calendar.iter_events(metadata["id"], metadata["name"]))
+
+
+def write_events(serialized_events, output: str) -> int:
+    """Stream the serialized events and their timezones to an iCal file."""
+    with open_output(output) as f:
+        count = write_ical(f, serialized_events)
+    log_output(output)
+    return count
 
-    # Get events from the selected calendar
-    calendar_id = metadata["id"]
-    calendar_name = metadata["name"]
 
-    return calendar.get_events(calendar_id, calendar_name)
+def log_output(output: str):
+    """Log where the calendar has been written."""
+    if output == "-":
+        logger.info("The calendar is written to the standard output")
+    else:
+        logger.info("The .ics calendar file is saved to %s", os.path.abspath(output))
+
+
+def log_counts(metadata: dict, counts: dict):
+    """Log the numbers of events of a calendar read, filtered and converted."""
+    spliced = counts.get("spliced", 0)
+    logger.info(
+        "Calendar '%s': a total of %d/%d events are converted",
+        metadata["name"],
+        counts["converted"] + spliced,
+        counts["read"] + spliced + counts["filtered"],
+    )
+    if spliced:
+        logger.info(
+            "Calendar '%s': %d events are unchanged since the previous export",
+            metadata["name"],
+            spliced,
+        )
+
+
+def calendar_output_path(output: str, metadata: dict) -> str:
+    """Return the output path of a calendar when exporting one file per calendar."""
+    return shard_path(output, metadata["alias_code"])
+
+
+def export_calendars(
+    calendar: TimeTreeCalendar,
+    metadatas: list,
+    output: str,
+    merge: bool = False,
+    workers: int = 4,
+    event_filter: EventFilter = None,
+    serializer: str = "icalendar",
+    jobs: int = 1,
+    update: bool = False,
+    shard_by: str = None,
+    **fetch_options,
+):
+    """Export the calendars concurrently.
+
+    Each calendar is fetched, converted and serialized by a pipeline run by a
+    worker of a bounded pool sharing the authenticated session. Events are
+    streamed to one file per calendar, or to a single file when merging or
+    exporting a single calendar, as soon as they are serialized. When merging,
+    the events of the calendars are interleaved in the order they are ready.
+    An output of "-" is the standard output, which implies merging. The
+    events are filtered as they are fetched, before they are converted. With
+    more than one job, the events are converted on a pool of worker processes
+    shared by the calendars. When updating, the events unchanged since the
+    previous export are copied from the existing output files. When sharding,
+    the events of all the calendars are split into files by year, month or
+    calendar instead, with a manifest listing the files.
+    """
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    # pylint: disable=too-many-locals
+    merged = (merge or output == "-") and len(metadatas) > 1
+    if event_filter is None:
+        event_filter = EventFilter()
+    if event_filter.start is not None or event_filter.end is not None:
+        # Precompute the timezone offsets for the exported span only
+        registry.set_span(event_filter.start, event_filter.end)
+
+    if update and not can_update(output):
+        logger.warning("Only plain files can be updated, %s is rewritten", output)
+        update = False
+
+    def export(metadata, writer=None):
+        counts = {}
+        events = get_events(calendar, metadata, **fetch_options)
+        events = filter_events(events, event_filter, counts)
+        path = output if len(metadatas) == 1 else calendar_output_path(output, metadata)
+        options = {"serializer": serializer, "jobs": jobs, "executor": pool}
+        if isinstance(writer, ShardedOutput):
+            writer.write_all(events, metadata, counts, **options)
+        elif update:
+            if writer is not None:
+                writer.write_all(events, counts, **options)
+            else:
+                with IncrementalOutput(path, serializer) as incremental:
+                    incremental.write_all(events, counts, **options)
+                log_output(path)
+        else:
+            serialized = export_events(events, counts, **options)
+            if writer is not None:
+                writer.write_all(serialized)
+            else:
+                write_events(serialized, path)
+        log_counts(metadata, counts)
+
+    pool = process_pool(jobs) if jobs > 1 else None
+    threads = ThreadPoolExecutor(max_workers=max(1, workers))
+    with pool or contextlib.nullcontext(), threads as executor:
+        if shard_by is not None:
+            with ShardedOutput(output, shard_by, update, serializer, workers) as shards:
+                list(executor.map(lambda metadata: export(metadata, shards), metadatas))
+            logger.info(
+                "The events are split into %d files listed in %s",
+                len(shards.shards),
+                os.path.abspath(manifest_path(output)),
+            )
+        elif merged:
+            with contextlib.ExitStack() as stack:
+                if update:
+                    writer = stack.enter_context(IncrementalOutput(output, serializer))
+                else:
+                    f = stack.enter_context(open_output(output))
+                    writer = stack.enter_context(ICalStreamWriter(f))
+                list(executor.map(lambda metadata: export(metadata, writer), metadatas))
+            log_output(output)
+            logger.info("A total of %d events are added to the calendar", writer.count)
+        else:
+            list(executor.map(export, metadatas))
+    logger.debug("Recurrence parsing cache: %s", parse_recurrence_parts.cache_info())
+
+
+def get_credentials(email: str = None) -> tuple:
+    """Get the email address and password from the environment or the user."""
+    if email:
+        pass
+    elif os.environ.get("TIMETREE_EMAIL"):
+        email = os.environ.get("TIMETREE_EMAIL")
+    else:
+        email = input("Enter your email address: ")
+
+    if os.environ.get("TIMETREE_PASSWORD"):
+        password = os.environ.get("TIMETREE_PASSWORD")
+    else:
+        password = safe_getpass(prompt="Enter your password: ", echo_char="*")
+
+    return email, password
+
+
+def create_calendar(args) -> TimeTreeCalendar:
+    """Log in, unless replaying recorded responses, and set up the calendar API."""
+    if args.replay:
+        calendar = TimeTreeCalendar(None, pool_size=args.workers)
+        calendar.response_cache = ResponseCache(args.cache_dir, replay=True)
+        return calendar
+
+    email, password = get_credentials(args.email)
+
+    if args.session_cache:
+        session_cache = SessionCache(args.cache_dir)
+        calendar = TimeTreeCalendar(
+            session_cache.login(email, password), pool_size=args.workers
+        )
+        calendar.reauthenticate = lambda stale_session_id: session_cache.login(
+            email, password, stale_session_id
+        )
+    else:
+        calendar = TimeTreeCalendar(login(email, password), pool_size=args.workers)
+
+    if args.record:
+        calendar.response_cache = ResponseCache(args.cache_dir)
+    return calendar
 
 
 def main():
@@ -87,7 +320,8 @@ def main():
         "-o",
         "--output",
         type=str,
-        help="Path to the output iCal file",
+        help="Path to the output iCal file, compressed if it ends in .gz, "
+        "or - for the standard output",
         default=os.path.join(os.getcwd(), "timetree.ics"),
     )
     parser.add_argument(
@@ -107,66 +341,170 @@ def main():
         "-c",
         "--calendar_code",
         type=str,
-        help="The Calendar Code you want to export",
+        action="append",
+        help="The Calendar Code you want to export (can be repeated)",
+        default=None,
+    )
+    parser.add_argument(
+        "-a",
+        "--all_calendars",
+        help="Export all active calendars",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--merge",
+        help="Write all exported calendars to a single iCal file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of calendars to export concurrently",
+        default=4,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Only download the changes since the previous export of the calendar",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Save fetched chunks so that an interrupted export can be resumed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--session_cache",
+        help="Reuse the login session across runs, logging in again only when it expires",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--timezone_cache",
+        help="Reuse the VTIMEZONE components generated by previous runs",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--record",
+        help="Save the raw API responses to the cache directory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--replay",
+        help="Export from the recorded API responses instead of the network",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        help="Directory for the local sync state and caches",
+        default=None,
+    )
+    parser.add_argument(
+        "--update_output",
+        help="Only render the events changed since the previous export, copying "
+        "the others from the existing output file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--shard_by",
+        choices=SHARD_BY,
+        help="Split the events into one iCal file per year, month (of their start) "
+        "or calendar, listed in a manifest",
+        default=None,
+    )
+    parser.add_argument(
+        "--from",
+        dest="window_start",
+        type=parse_window_bound,
+        help="Only export events ending after this date (YYYY-MM-DD or ISO 8601)",
+        default=None,
+    )
+    parser.add_argument(
+        "--to",
+        dest="window_end",
+        type=lambda value: parse_window_bound(value, is_end=True),
+        help="Only export events starting before the end of this date "
+        "(YYYY-MM-DD or ISO 8601)",
         default=None,
     )
+    parser.add_argument(
+        "--updated_since",
+        type=parse_window_bound,
+        help="Only export events modified since this date (YYYY-MM-DD or ISO 8601)",
+        default=None,
+    )
+    parser.add_argument(
+        "--label",
+        type=parse_label,
+        action="append",
+        help="Only export events with this label, by number (1-9) or color name "
+        "(can be repeated)",
+        default=None,
+    )
+    parser.add_argument(
+        "--title",
+        type=re.compile,
+        help="Only export events whose title matches this regular expression",
+        default=None,
+    )
+    parser.add_argument(
+        "--serializer",
+        choices=("icalendar", "direct"),
+        help="Build the iCal events with the icalendar library, or write them "
+        "directly (faster, same output)",
+        default="icalendar",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of worker processes converting the events (default: 1, "
+        "in the main process)",
+        default=1,
+    )
     parser.add_argument(
         "--version",
         action="version",
         version=f"%(prog)s {__version__}",
     )
     args = parser.parse_args()
-
-    if args.email:
-        email = args.email
-    elif os.environ.get("TIMETREE_EMAIL"):
-        email = os.environ.get("TIMETREE_EMAIL")
-    else:
-        email = input("Enter your email address: ")
-
-    if os.environ.get("TIMETREE_PASSWORD"):
-        password = os.environ.get("TIMETREE_PASSWORD")
-    else:
-        password = safe_getpass(prompt="Enter your password: ", echo_char="*")
+    if args.shard_by and args.output == "-":
+        parser.error("--shard_by needs an output file")
 
     # Set logging level
     if args.verbose:
         package_logger.setLevel(logging.DEBUG)
 
-    # Set up calendar
-    cal = Calendar()
-    cal.add("prodid", f"-//TimeTree Exporter {version('timetree_exporter')}//EN")
-    cal.add("version", "2.0")
+    if args.timezone_cache:
+        # Reuse the VTIMEZONE components generated by previous runs
+        vtimezones.set_cache_dir(get_cache_dir(args.cache_dir))
 
-    events = get_events(email, password, args.calendar_code)
+    # Keep the standard output for the calendar when writing it there, the
+    # login and calendar selection prompts go to the standard error instead
+    with contextlib.redirect_stdout(sys.stderr if args.output == "-" else sys.stdout):
+        calendar = create_calendar(args)
+        metadatas = select_calendars(calendar, args.calendar_code, args.all_calendars)
 
-    logger.info("Found %d events", len(events))
-
-    # Add events to calendar
-    for event in events:
-        time_tree_event = TimeTreeEvent.from_dict(event)
-        formatter = ICalEventFormatter(time_tree_event)
-        ical_event = formatter.to_ical()
-        if ical_event is None:
-            continue
-        cal.add_component(ical_event)
-
-    logger.info(
-        "A total of %d/%d events are added to the calendar",
-        len(cal.subcomponents),
-        len(events),
+    export_calendars(
+        calendar,
+        metadatas,
+        args.output,
+        merge=args.merge,
+        workers=args.workers,
+        serializer=args.serializer,
+        jobs=args.jobs,
+        update=args.update_output,
+        shard_by=args.shard_by,
+        event_filter=EventFilter(
+            labels=frozenset(args.label) if args.label else None,
+            start=args.window_start,
+            end=args.window_end,
+            updated_since=args.updated_since,
+            title=args.title,
+        ),
+        incremental=args.incremental,
+        cache_dir=args.cache_dir,
+        checkpoint=args.checkpoint,
     )
 
-    # Add the required timezone information
-    cal.add_missing_timezones()
-
-    # Write calendar to file
-    with open(args.output, "wb") as f:  # Path Traversal Vulnerability if on a server
-        f.write(cal.to_ical())
-        logger.info(
-            "The .ics calendar file is saved to %s", os.path.abspath(args.output)
-        )
-
 
 if __name__ == "__main__":
     main()
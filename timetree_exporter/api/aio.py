@@ -0,0 +1,262 @@
+"""
+Asynchronous TimeTree API client built on aiohttp.
+
+A single AsyncTimeTreeClient owns the connection pool and can be shared by
+many accounts and calendars driven from the same event loop:
+
+    async with AsyncTimeTreeClient(concurrency=20) as client:
+        session_id = await client.login(email, password)
+        calendar = client.calendar(session_id)
+        async for chunk in calendar.iter_event_chunks(calendar_id):
+            ...
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Union
+
+from requests.exceptions import HTTPError
+
+from timetree_exporter.api.auth import (
+    LOGIN_HEADERS,
+    LOGIN_PATH,
+    AuthenticationError,
+    login_payload,
+)
+from timetree_exporter.api.calendar import RETRY_STATUSES, SyncChunk
+from timetree_exporter.api.const import API_BASEURI, API_USER_AGENT
+from timetree_exporter.merge import merge_events
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "X-Timetreea": API_USER_AGENT,
+}
+
+
+def import_aiohttp():
+    """Import aiohttp, which is only required for the asynchronous client."""
+    try:
+        import aiohttp  # pylint: disable=C0415
+
+        return aiohttp
+    except ImportError as exc:
+        logger.error("aiohttp module is required for the asynchronous client.")
+        raise ImportError(
+            "Please install aiohttp to use the asynchronous client."
+        ) from exc
+
+
+class AsyncTimeTreeClient:
+    """
+    Shared connection pool for asynchronous TimeTree API requests.
+    At most `concurrency` requests are in flight at any time. Like the
+    synchronous client, GET requests failing with a transient error, a
+    connection error or a timeout are retried with exponential backoff,
+    honoring Retry-After.
+    """
+
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+
+    def __init__(
+        self,
+        concurrency: int = 10,
+        timeout: float = 30,
+        retries: int = 5,
+        backoff_factor: float = 0.5,
+        base_uri: str = API_BASEURI,
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.base_uri = base_uri
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """Open the underlying HTTP session."""
+        if self.session is None:
+            aiohttp = import_aiohttp()
+            # Created here so that it is bound to the running event loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                # Session cookies are sent per request so that accounts can share
+                # the pool without sharing a cookie jar
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def retry_delay(self, attempt: int, retry_after: str = None) -> float:
+        """Return the delay before retrying a request for the attempt-th time."""
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        return self.backoff_factor * 2 ** (attempt - 1)
+
+    async def request(self, method: str, url: str, **kwargs):
+        """Send a request and return the status, cookies and decoded JSON body."""
+        await self.open()
+        # Connection errors and timeouts are retried like transient responses
+        transient_errors = (import_aiohttp().ClientError, asyncio.TimeoutError)
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        if response.status == 200:
+                            body = await response.json(content_type=None)
+                            text = None
+                        else:
+                            body, text = None, await response.text()
+                        retry_after = response.headers.get("Retry-After")
+            except transient_errors as exc:
+                if method != "GET" or attempt >= self.retries:
+                    raise
+                attempt += 1
+                delay = self.retry_delay(attempt)
+                logger.debug("Retrying %s after %r in %.2fs", url, exc, delay)
+                await asyncio.sleep(delay)
+                continue
+            if (
+                method != "GET"
+                or response.status not in RETRY_STATUSES
+                or attempt >= self.retries
+            ):
+                return response.status, response.cookies, body, text
+            attempt += 1
+            delay = self.retry_delay(attempt, retry_after)
+            logger.debug(
+                "Retrying %s after a %d response in %.2fs", url, response.status, delay
+            )
+            # The semaphore is released while waiting
+            await asyncio.sleep(delay)
+
+    async def login(self, email, password) -> Union[str, None]:
+        """
+        Log in to the TimeTree app and return the session ID.
+        """
+        status, cookies, _, text = await self.request(
+            "PUT",
+            f"{self.base_uri}{LOGIN_PATH}",
+            json=login_payload(email, password),
+            headers=LOGIN_HEADERS,
+        )
+        if status != 200:
+            logger.error("Login failed: %s", text)
+            raise AuthenticationError("Login failed")
+
+        morsel = cookies.get("_session_id")
+        return morsel.value if morsel is not None else None
+
+    def calendar(self, session_id: str) -> "AsyncTimeTreeCalendar":
+        """Return a calendar API bound to the session ID."""
+        return AsyncTimeTreeCalendar(self, session_id)
+
+
+class AsyncTimeTreeCalendar:
+    """
+    Asynchronous counterpart of TimeTreeCalendar
+    """
+
+    def __init__(self, client: AsyncTimeTreeClient, session_id: str):
+        self.client = client
+        self.session_id = session_id
+        # Coroutine function called with the rejected session ID to get a new
+        # one on a 401 response
+        self.reauthenticate = None
+        self.reauthenticate_lock = None
+
+    async def get(self, url: str, **kwargs):
+        """
+        Send a GET request, refreshing the session once if it has expired.
+        """
+        session_id = self.session_id
+        headers = {**HEADERS, "Cookie": f"_session_id={session_id}"}
+        response = await self.client.request("GET", url, headers=headers, **kwargs)
+        if response[0] == 401 and self.reauthenticate is not None:
+            if self.reauthenticate_lock is None:
+                # Created here so that it is bound to the running event loop
+                self.reauthenticate_lock = asyncio.Lock()
+            async with self.reauthenticate_lock:
+                # Requests rejected with the same session log in again only once
+                if self.session_id == session_id:
+                    logger.info("Session expired, logging in again")
+                    # pylint: disable-next=not-callable
+                    self.session_id = await self.reauthenticate(session_id)
+            headers["Cookie"] = f"_session_id={self.session_id}"
+            response = await self.client.request("GET", url, headers=headers, **kwargs)
+        return response
+
+    async def get_metadata(self):
+        """
+        Get calendar metadata.
+        """
+        url = f"{self.client.base_uri}/calendars?since=0"
+        status, _, body, text = await self.get(url)
+        if status != 200:
+            logger.error(text)
+            raise HTTPError("Failed to get calendar metadata")
+        return body["calendars"]
+
+    async def iter_event_chunks(
+        self, calendar_id: int, calendar_name: str = None, since: int = None
+    ) -> AsyncIterator[SyncChunk]:
+        """
+        Iterate over the sync chunks of the calendar as they are fetched.
+        """
+        url = f"{self.client.base_uri}/calendar/{calendar_id}/events/sync"
+        while True:
+            status, _, body, text = await self.get(
+                url, params=None if since is None else {"since": since}
+            )
+            if status != 200:
+                logger.error(
+                    "Failed to get events of the calendar '%s'",
+                    calendar_name or calendar_id,
+                )
+                logger.error(text)
+                raise HTTPError("Failed to get events of the calendar")
+
+            chunk = SyncChunk.from_json(body)
+            yield chunk
+
+            if not chunk.chunk:
+                return
+            since = chunk.since
+
+    async def iter_events(
+        self, calendar_id: int, calendar_name: str = None, since: int = None
+    ) -> AsyncIterator[dict]:
+        """
+        Iterate over the events of the calendar, one sync chunk at a time.
+        """
+        async for chunk in self.iter_event_chunks(calendar_id, calendar_name, since):
+            for event in chunk.events:
+                yield event
+
+    async def get_events(self, calendar_id: int, calendar_name: str = None):
+        """
+        Get events from the calendar.
+        """
+        return merge_events(
+            [event async for event in self.iter_events(calendar_id, calendar_name)]
+        )
@@ -2,31 +2,47 @@
 This module contains the User class, which is responsible for handling user-related operations.
 """
 
+import hashlib
+import json
+import os
 import uuid
 import logging
 from typing import Union
 import requests
 from timetree_exporter.api.const import API_BASEURI, API_USER_AGENT
+from timetree_exporter.utils import file_lock, get_cache_dir, write_json_atomic
 
 logger = logging.getLogger(__name__)
 
 
-def login(email, password) -> Union[str, None]:
+LOGIN_PATH = "/auth/email/signin"
+LOGIN_HEADERS = {
+    "Content-Type": "application/json",
+    "X-Timetreea": API_USER_AGENT,
+}
+
+
+def login_payload(email, password) -> dict:
     """
-    Log in to the TimeTree app and return the session ID.
+    Return the payload of the sign-in request.
     """
-    url = f"{API_BASEURI}/auth/email/signin"
-    payload = {
+    return {
         "uid": email,
         "password": password,
         "uuid": str(uuid.uuid4()).replace("-", ""),
     }
-    headers = {
-        "Content-Type": "application/json",
-        "X-Timetreea": API_USER_AGENT,
-    }
 
-    response = requests.put(url, json=payload, headers=headers, timeout=10)
+
+def login(email, password, base_uri: str = API_BASEURI) -> Union[str, None]:
+    """
+    Log in to the TimeTree app and return the session ID.
+    """
+    response = requests.put(
+        f"{base_uri}{LOGIN_PATH}",
+        json=login_payload(email, password),
+        headers=LOGIN_HEADERS,
+        timeout=10,
+    )
 
     if response.status_code != 200:
         logger.error("Login failed: %s", response.text)
@@ -39,6 +55,60 @@ def login(email, password) -> Union[str, None]:
         return None
 
 
+class SessionCache:
+    """
+    On-disk cache of session IDs keyed by account, shared between processes.
+
+    The cache file is guarded by a file lock, so that parallel exports log in
+    at most once and reuse each other's session.
+    """
+
+    def __init__(self, cache_dir: str = None, base_uri: str = API_BASEURI):
+        directory = get_cache_dir(cache_dir)
+        self.path = os.path.join(directory, "sessions.json")
+        self.lock_path = os.path.join(directory, "sessions.lock")
+        self.base_uri = base_uri
+
+    @staticmethod
+    def key(email: str) -> str:
+        """Return the cache key of the account."""
+        return hashlib.sha256(email.strip().lower().encode("UTF-8")).hexdigest()
+
+    def read(self) -> dict:
+        """Read all cached sessions. Must be called with the lock held."""
+        try:
+            with open(self.path, "r", encoding="UTF-8") as cache_file:
+                return json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write(self, sessions: dict):
+        """
+        Write all cached sessions, readable by the owner only. Must be called
+        with the lock held.
+        """
+        # Replaced atomically, so that an interrupted write keeps the old sessions
+        write_json_atomic(self.path, sessions, mode=0o600)
+
+    def login(self, email, password, stale_session_id: str = None) -> str:
+        """
+        Return the cached session ID of the account, logging in if there is none
+        or if the cached one is the given stale (rejected) session ID.
+        """
+        with file_lock(self.lock_path):
+            sessions = self.read()
+            session_id = sessions.get(self.key(email))
+            if session_id is not None and session_id != stale_session_id:
+                logger.debug("Reusing cached session")
+                return session_id
+
+            session_id = login(email, password, self.base_uri)
+            if session_id is not None:
+                sessions[self.key(email)] = session_id
+                self.write(sessions)
+            return session_id
+
+
 class AuthenticationError(Exception):
     """
     Exception raised when the user is not authorized to access the resource.
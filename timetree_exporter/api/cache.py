@@ -0,0 +1,87 @@
+"""
+Cache of raw TimeTree API responses, used to record the responses of an
+export and to replay them later without touching the network.
+"""
+
+import gzip
+import hashlib
+import io
+import logging
+import os
+from typing import Iterable, Iterator
+
+import requests
+
+from timetree_exporter.utils import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Gzip compressed raw responses keyed by request URL.
+    In replay mode responses are served from the cache instead of the network.
+    """
+
+    def __init__(self, cache_dir: str = None, replay: bool = False):
+        self.directory = os.path.join(get_cache_dir(cache_dir), "responses")
+        os.makedirs(self.directory, exist_ok=True)
+        self.replay = replay
+
+    @staticmethod
+    def request_url(url: str, params: dict = None) -> str:
+        """Return the full URL of the request, including the query string."""
+        return requests.Request("GET", url, params=params).prepare().url
+
+    def path(self, url: str, params: dict = None) -> str:
+        """Return the path of the cached response of the request."""
+        digest = hashlib.sha256(self.request_url(url, params).encode("UTF-8"))
+        return os.path.join(self.directory, f"{digest.hexdigest()}.json.gz")
+
+    def save(self, url: str, params: dict, content: bytes):
+        """Save the raw body of a successful response."""
+        path = self.path(url, params)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wb") as cache_file:
+            cache_file.write(content)
+        os.replace(tmp_path, path)
+
+    def tee(self, url: str, params: dict, pieces: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Pass the pieces of a streamed response body through while saving them.
+        The response is only saved once the body has been read completely.
+        """
+        path = self.path(url, params)
+        tmp_path = f"{path}.tmp"
+        try:
+            with gzip.open(tmp_path, "wb") as cache_file:
+                for piece in pieces:
+                    cache_file.write(piece)
+                    yield piece
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    def load(self, url: str, params: dict = None) -> requests.Response:
+        """Return the cached response of the request."""
+        try:
+            with gzip.open(self.path(url, params), "rb") as cache_file:
+                content = cache_file.read()
+        except FileNotFoundError as exc:
+            raise ResponseCacheMiss(
+                f"No recorded response for {self.request_url(url, params)}"
+            ) from exc
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.request_url(url, params)
+        response.encoding = "UTF-8"
+        response.raw = io.BytesIO(content)
+        return response
+
+
+class ResponseCacheMiss(Exception):
+    """
+    Exception raised when replaying a request that has not been recorded.
+    """
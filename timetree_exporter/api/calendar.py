@@ -2,32 +2,138 @@
 Timetree calendar API
 """
 
+import dataclasses
 import json
 import logging
+from http.cookies import SimpleCookie
+from typing import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
+from urllib3.util.retry import Retry
 
 from timetree_exporter.api.const import API_BASEURI, API_USER_AGENT
+from timetree_exporter.api.stream import iter_json_array
+from timetree_exporter.merge import merge_events
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Size of the pieces in which sync responses are read and decoded
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@dataclasses.dataclass
+class SyncChunk:
+    """A single page returned by the events sync endpoint"""
+
+    events: list
+    since: int
+    chunk: bool
+
+    @classmethod
+    def from_json(cls, r_json: dict):
+        """Create SyncChunk object from the decoded sync response"""
+        chunk = cls(
+            events=r_json["events"],
+            since=r_json["since"],
+            chunk=r_json["chunk"] is True,
+        )
+        logger.info("Fetched %d events", len(chunk.events))
+        return chunk
+
+
+def sent_session_id(response: requests.Response) -> str:
+    """Return the session ID sent with the request of the response, if any."""
+    morsel = SimpleCookie(response.request.headers.get("Cookie", "")).get("_session_id")
+    return morsel.value if morsel is not None else None
+
 
 class TimeTreeCalendar:
     """
     Timetree calendar API
     """
 
-    def __init__(self, session_id: str):
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+
+    def __init__(
+        self,
+        session_id: str,
+        pool_size: int = 10,
+        retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 30,
+    ):
+        # Requests already accepts every compression urllib3 can decode (gzip,
+        # deflate, and br or zstd when the optional decoders are installed)
         self.session = requests.Session()
+        self.session_id = None
+        self.set_session_id(session_id)
+        self.timeout = timeout
+        self.base_uri = API_BASEURI
+        # Retry transient failures with exponential backoff, honoring Retry-After
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # Allow as many pooled connections as concurrent calendar fetches
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Called with the rejected session ID to get a new one on a 401 response
+        self.reauthenticate = None
+        # Records raw responses, or serves them back in replay mode
+        self.response_cache = None
+
+    def set_session_id(self, session_id: str):
+        """Replace the session cookie sent with the requests."""
+        # Remove the cookie for every domain, including ones set by the server
+        self.session.cookies.set("_session_id", None)
         self.session.cookies.set("_session_id", session_id)
+        self.session_id = session_id
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request, refreshing the session once if it has expired.
+        """
+        cache = self.response_cache
+        if cache is not None and cache.replay:
+            return cache.load(url, kwargs.get("params"))
+
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.get(url, **kwargs)
+        if response.status_code == 401 and self.reauthenticate is not None:
+            logger.info("Session expired, logging in again")
+            response.close()
+            # The session shared with other threads may already have been
+            # replaced, so report the one this request was rejected with
+            # pylint: disable-next=not-callable
+            self.set_session_id(self.reauthenticate(sent_session_id(response)))
+            response = self.session.get(url, **kwargs)
+
+        # Streamed responses are recorded by the caller while they are read
+        if (
+            cache is not None
+            and response.status_code == 200
+            and not kwargs.get("stream")
+        ):
+            cache.save(url, kwargs.get("params"), response.content)
+        return response
 
     def get_metadata(self):
         """
         Get calendar metadata.
         """
-        url = f"{API_BASEURI}/calendars?since=0"
-        response = self.session.get(
+        url = f"{self.base_uri}/calendars?since=0"
+        response = self.get(
             url,
             headers={
                 "Content-Type": "application/json",
@@ -39,35 +145,22 @@ class TimeTreeCalendar:
             raise HTTPError("Failed to get calendar metadata")
         return response.json()["calendars"]
 
-    def get_events_recur(self, calendar_id: int, since: int):
+    def fetch_chunk(
+        self, calendar_id: int, calendar_name: str = None, since: int = None
+    ) -> SyncChunk:
         """
-        Get events from the calendar.(Recursively)
+        Fetch a single sync chunk of the calendar.
         """
-        url = f"{API_BASEURI}/calendar/{calendar_id}/events/sync?since={since}"
-        response = self.session.get(
+        url = f"{self.base_uri}/calendar/{calendar_id}/events/sync"
+        params = None if since is None else {"since": since}
+        response = self.get(
             url,
+            params=params,
             headers={
                 "Content-Type": "application/json",
                 "X-Timetreea": API_USER_AGENT,
             },
-        )
-
-        r_json = response.json()
-
-        events = r_json["events"]
-        logger.info("Fetched %d events", len(events))
-        if r_json["chunk"] is True:
-            events.extend(self.get_events_recur(calendar_id, r_json["since"]))
-        return events
-
-    def get_events(self, calendar_id: int, calendar_name: str = None):
-        """
-        Get events from the calendar.
-        """
-        url = f"{API_BASEURI}/calendar/{calendar_id}/events/sync"
-        response = self.session.get(
-            url,
-            headers={"Content-Type": "application/json", "X-Timetreea": API_USER_AGENT},
+            stream=True,
         )
         if response.status_code != 200:
             if calendar_name is not None:
@@ -75,12 +168,80 @@ class TimeTreeCalendar:
             else:
                 logger.error("Failed to get events of the calendar")
             logger.error(response.text)
+            raise HTTPError("Failed to get events of the calendar")
+
+        # Decode the events while the body is downloaded instead of buffering it
+        with response:
+            pieces = response.iter_content(STREAM_CHUNK_SIZE)
+            if self.response_cache is not None and not self.response_cache.replay:
+                pieces = self.response_cache.tee(url, params, pieces)
+            fields = {}
+            events = list(iter_json_array(pieces, "events", fields))
+            # Read the rest of the body, so that a recorded response is complete
+            for _ in pieces:
+                pass
+        return SyncChunk.from_json({**fields, "events": events})
+
+    def iter_event_chunks(
+        self,
+        calendar_id: int,
+        calendar_name: str = None,
+        since: int = None,
+        checkpoint=None,
+    ) -> Iterator[SyncChunk]:
+        """
+        Iterate over the sync chunks of the calendar as they are fetched.
+
+        If a checkpoint is given, the chunks saved by an interrupted run are
+        replayed first, every newly fetched chunk is saved, and the checkpoint
+        is cleared once all chunks have been consumed.
+        """
+        chunk = None
+        if checkpoint is not None:
+            saved_chunks = checkpoint.load()
+            if saved_chunks:
+                logger.info("Resuming from %d checkpointed chunks", len(saved_chunks))
+                yield from saved_chunks
+                chunk = saved_chunks[-1]
+                since = chunk.since
+
+        while chunk is None or chunk.chunk:
+            chunk = self.fetch_chunk(calendar_id, calendar_name, since)
+            if checkpoint is not None:
+                checkpoint.save(chunk)
+            yield chunk
+            since = chunk.since
+
+        if checkpoint is not None:
+            checkpoint.clear()
 
-        r_json = response.json()
-        events = r_json["events"]
-        logger.info("Fetched %d events", len(events))
-        if r_json["chunk"] is True:
-            events.extend(self.get_events_recur(calendar_id, r_json["since"]))
+    def iter_events(
+        self,
+        calendar_id: int,
+        calendar_name: str = None,
+        since: int = None,
+        checkpoint=None,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the events of the calendar, one sync chunk at a time.
+        """
+        for chunk in self.iter_event_chunks(
+            calendar_id, calendar_name, since, checkpoint
+        ):
+            yield from chunk.events
+
+    def get_events_recur(self, calendar_id: int, since: int):
+        """
+        Get events from the calendar starting at the given sync cursor.
+        Events returned more than once are deduplicated by uuid.
+        """
+        return merge_events(self.iter_events(calendar_id, since=since))
+
+    def get_events(self, calendar_id: int, calendar_name: str = None):
+        """
+        Get events from the calendar.
+        """
+        events = merge_events(self.iter_events(calendar_id, calendar_name))
 
         logger.debug(
             "Top 5 fetched events: \n %s",
@@ -2,5 +2,8 @@
 Constants for timetree_exporter
 """
 
-API_BASEURI = "https://timetreeapp.com/api/v1"
+import os
+
+# Can be pointed at another server, e.g. the local fake server, for testing
+API_BASEURI = os.environ.get("TIMETREE_API_BASEURI", "https://timetreeapp.com/api/v1")
 API_USER_AGENT = "web/2.1.0/en"
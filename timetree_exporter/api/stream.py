@@ -0,0 +1,113 @@
+"""
+Incremental decoding of JSON response bodies.
+
+The items of one array member of the top-level object (e.g. the events of a
+sync response) are decoded and yielded while the body is still being
+downloaded, so that the raw bytes never have to be held in full.
+"""
+
+import codecs
+import json
+from typing import Iterable, Iterator
+
+WHITESPACE = " \t\n\r"
+
+
+class JSONStreamReader:
+    """
+    Reader over a stream of byte pieces that decodes one JSON value at a time.
+    Consumed text is dropped from the buffer as more pieces arrive.
+    """
+
+    def __init__(self, pieces: Iterable[bytes]):
+        self.pieces = iter(pieces)
+        self.text_decoder = codecs.getincrementaldecoder("UTF-8")()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read the next piece into the buffer. Return False at the end."""
+        if self.eof:
+            return False
+        try:
+            text = self.text_decoder.decode(next(self.pieces))
+        except StopIteration:
+            text = self.text_decoder.decode(b"", final=True)
+            self.eof = True
+        self.buffer = self.buffer[self.pos :] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise json.JSONDecodeError(
+                    "Unexpected end of data", self.buffer, self.pos
+                )
+
+    def expect(self, chars: str) -> str:
+        """Consume the next non-whitespace character, which must be in chars."""
+        char = self.peek()
+        if char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number or literal at the end of the buffer may continue
+            # in the next piece
+            if end == len(self.buffer) and self.buffer[self.pos] not in '{["':
+                if self.fill():
+                    continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(
+    pieces: Iterable[bytes], array_key: str, fields: dict = None
+) -> Iterator:
+    """
+    Yield the items of the array member `array_key` of the top-level JSON object
+    as they are decoded. The other members are stored in `fields`.
+    """
+    if fields is None:
+        fields = {}
+    reader = JSONStreamReader(pieces)
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == array_key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            fields[key] = reader.value()
+        if reader.expect(",}") == "}":
+            return
@@ -1,13 +1,122 @@
 """This module provides the TimeTreeEvent class for representing TimeTree events."""
 
 import dataclasses
+import operator
+import sys
+from typing import Iterable
 
+# TimeTree label_id to CSS color mapping
+COLOR_MAP = {
+    1: "#08808F",  # Teal
+    2: "#6C5E58",  # Grey
+    3: "#1963A4",  # Blue
+    4: "#AF3D19",  # Deep Orange
+    5: "#2C377C",  # Dark Blue
+    6: "#A62E2E",  # Plum
+    7: "#681D7B",  # Orchid
+    8: "#B46604",  # Orange
+    9: "#5B8232",  # Green
+}
 
-class TimeTreeEvent:
+# TimeTree label_id to CSS color name mapping
+CATEGORY_MAP = {
+    1: "teal",
+    2: "grey",
+    3: "blue",
+    4: "deeporange",
+    5: "darkblue",
+    6: "plum",
+    7: "orchid",
+    8: "orange",
+    9: "green",
+}
+
+# TimeTreeEvent attributes in constructor order, with their JSON keys
+EVENT_FIELDS = (
+    ("uuid", "uuid"),
+    ("title", "title"),
+    ("created_at", "created_at"),
+    ("updated_at", "updated_at"),
+    ("recurrences", "recurrences"),
+    ("alerts", "alerts"),
+    ("url", "url"),
+    ("note", "note"),
+    ("start_at", "start_at"),
+    ("end_at", "end_at"),
+    ("all_day", "all_day"),
+    ("start_timezone", "start_timezone"),
+    ("end_timezone", "end_timezone"),
+    ("location_lat", "location_lat"),
+    ("location_lon", "location_lon"),
+    ("location", "location"),
+    ("parent_id", "parent_id"),
+    ("event_type", "type"),
+    ("category", "category"),
+    ("label_id", "label_id"),
+)
+
+EVENT_KEYS = tuple(key for _, key in EVENT_FIELDS)
+EVENT_FIELD_GETTER = operator.itemgetter(*EVENT_KEYS)
+
+
+def intern_string(value):
+    """Intern strings that repeat across events, such as timezone names."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def label_to_int(label_id):
+    """Convert a TimeTree label_id to int, or None if it is not a valid number."""
+    if label_id is None:
+        return None
+    try:
+        return int(label_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class TimeTreeEventBase:
+    """Behaviour shared by TimeTreeEvent and the alternative event representations
+
+    Subclasses provide the event attributes (uuid, title, label_id, ...).
+    """
+
+    __slots__ = ()
+
+    title: str
+    label_id: int
+
+    def get_ical_color(self) -> str:
+        """Get iCal color based on TimeTree label_id.
+
+        TimeTree uses label_id 1-9 for different colors.
+        This method maps them to standard iCal color values.
+
+        Returns:
+            str: Hex color code for iCal COLOR property, or None if no label_id
+        """
+        return COLOR_MAP.get(label_to_int(self.label_id))
+
+    def get_ical_category(self) -> str:
+        """Get iCal category name based on TimeTree label_id.
+
+        This provides an alternative to COLOR for better calendar compatibility.
+
+        Returns:
+            str: Category name for iCal CATEGORIES property, or None if no label_id
+        """
+        return CATEGORY_MAP.get(label_to_int(self.label_id))
+
+    def __str__(self):
+        return self.title
+
+
+class TimeTreeEvent(TimeTreeEventBase):
     """TimeTree event class"""
 
     # pylint: disable=too-many-instance-attributes
 
+    __slots__ = tuple(attribute for attribute, _ in EVENT_FIELDS)
+
     def __init__(
         self,
         uuid: str,
@@ -44,106 +153,113 @@ class TimeTreeEvent:
         self.location_lon = location_lon
         self.url = url
         self.start_at = start_at
-        self.start_timezone = start_timezone
+        self.start_timezone = intern_string(start_timezone)
         self.end_at = end_at
-        self.end_timezone = end_timezone
+        self.end_timezone = intern_string(end_timezone)
         self.all_day = all_day
         self.alerts = alerts
         self.recurrences = recurrences
         self.parent_id = parent_id
         self.event_type = event_type
         self.category = category
-        self.label_id = label_id
+        self.label_id = intern_string(label_id)
 
     @classmethod
     def from_dict(cls, event_data: dict):
         """Create TimeTreeEvent object from JSON data"""
+        get = event_data.get
         return cls(
-            uuid=event_data.get("uuid"),
-            title=event_data.get("title"),
-            created_at=event_data.get("created_at"),
-            updated_at=event_data.get("updated_at"),
-            note=event_data.get("note"),
-            location=event_data.get("location"),
-            location_lat=event_data.get("location_lat"),
-            location_lon=event_data.get("location_lon"),
-            url=event_data.get("url"),
-            start_at=event_data.get("start_at"),
-            start_timezone=event_data.get("start_timezone"),
-            end_at=event_data.get("end_at"),
-            end_timezone=event_data.get("end_timezone"),
-            all_day=event_data.get("all_day"),
-            alerts=event_data.get("alerts"),
-            recurrences=event_data.get("recurrences"),
-            parent_id=event_data.get("parent_id"),
-            event_type=event_data.get("type"),
-            category=event_data.get("category"),
-            label_id=event_data.get("label_id"),
+            get("uuid"),
+            get("title"),
+            get("created_at"),
+            get("updated_at"),
+            get("recurrences"),
+            get("alerts"),
+            get("url"),
+            get("note"),
+            get("start_at"),
+            get("end_at"),
+            get("all_day"),
+            get("start_timezone"),
+            get("end_timezone"),
+            get("location_lat"),
+            get("location_lon"),
+            get("location"),
+            get("parent_id"),
+            get("type"),
+            get("category"),
+            get("label_id"),
         )
 
-    def get_ical_color(self) -> str:
-        """Get iCal color based on TimeTree label_id.
-        
-        TimeTree uses label_id 1-9 for different colors.
-        This method maps them to standard iCal color values.
-        
-        Returns:
-            str: Hex color code for iCal COLOR property, or None if no label_id
-        """
-        if self.label_id is None:
-            return None
-            
-        # TimeTree label_id to CSS color mapping
-        color_map = {
-            1: "#08808F",  # Teal
-            2: "#6C5E58",  # Grey
-            3: "#1963A4",  # Blue
-            4: "#AF3D19",  # Deep Orange
-            5: "#2C377C",  # Dark Blue
-            6: "#A62E2E",  # Plum
-            7: "#681D7B",  # Orchid
-            8: "#B46604",  # Orange
-            9: "#5B8232",  # Green
-        }
-        
-        try:
-            label_id_int = int(self.label_id)
-            return color_map.get(label_id_int)
-        except (ValueError, TypeError):
-            return None
+    @classmethod
+    def from_dicts(cls, events: Iterable[dict]) -> list:
+        """Create TimeTreeEvent objects from many JSON events at once
 
-    def get_ical_category(self) -> str:
-        """Get iCal category name based on TimeTree label_id.
-        
-        This provides an alternative to COLOR for better calendar compatibility.
-        
-        Returns:
-            str: Category name for iCal CATEGORIES property, or None if no label_id
+        All fields are picked from each event with a single C-level itemgetter
+        call, falling back to dict.get for events with missing keys.
         """
-        if self.label_id is None:
-            return None
-            
-        # TimeTree label_id to CSS color name mapping
-        category_map = {
-            1: "teal",
-            2: "grey", 
-            3: "blue",
-            4: "deeporange",
-            5: "darkblue",
-            6: "plum",
-            7: "orchid",
-            8: "orange",
-            9: "green",
-        }
-        
-        try:
-            label_id_int = int(self.label_id)
-            return category_map.get(label_id_int)
-        except (ValueError, TypeError):
-            return None
+        get_fields = EVENT_FIELD_GETTER
+        keys = EVENT_KEYS
+        result = []
+        append = result.append
+        for event_data in events:
+            try:
+                append(cls(*get_fields(event_data)))
+            except KeyError:
+                append(cls(*map(event_data.get, keys)))
+        return result
 
-    def __str__(self):
-        return self.title
+
+def view_field(key: str) -> property:
+    """Return a property reading a key of the wrapped JSON event."""
+    return property(
+        lambda view: view.event_data.get(key),
+        doc=f"The {key} of the event.",
+    )
+
+
+class TimeTreeEventView(TimeTreeEventBase):
+    """Read-only TimeTreeEvent over a JSON event, without copying its fields
+
+    Attributes are looked up in the wrapped dict when accessed, so events that
+    are skipped after checking a field or two cost a single small object.
+    """
+
+    __slots__ = ("event_data",)
+
+    uuid = view_field("uuid")
+    title = view_field("title")
+    created_at = view_field("created_at")
+    updated_at = view_field("updated_at")
+    recurrences = view_field("recurrences")
+    alerts = view_field("alerts")
+    url = view_field("url")
+    note = view_field("note")
+    start_at = view_field("start_at")
+    end_at = view_field("end_at")
+    all_day = view_field("all_day")
+    start_timezone = view_field("start_timezone")
+    end_timezone = view_field("end_timezone")
+    location_lat = view_field("location_lat")
+    location_lon = view_field("location_lon")
+    location = view_field("location")
+    parent_id = view_field("parent_id")
+    event_type = view_field("type")
+    category = view_field("category")
+    label_id = view_field("label_id")
+
+    def __init__(self, event_data: dict):
+        self.event_data = event_data
+
+    @classmethod
+    def from_dict(cls, event_data: dict):
+        """Create TimeTreeEventView object from JSON data"""
+        return cls(event_data)
+
+    @classmethod
+    def from_dicts(cls, events: Iterable[dict]) -> list:
+        """Create TimeTreeEventView objects from many JSON events at once"""
+        return list(map(cls, events))
 
 
 @dataclasses.dataclass
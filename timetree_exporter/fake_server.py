@@ -0,0 +1,305 @@
+"""
+Local stand-in for the TimeTree API, for load and latency testing.
+
+It implements the sign-in, calendar metadata and events sync endpoints used by
+the exporter, serves synthetic calendars of any size in chunks, and can add
+latency and inject transient errors. Run it with
+
+    python -m timetree_exporter.fake_server --events 100000
+
+and point the exporter at it with the TIMETREE_API_BASEURI environment variable.
+"""
+
+import argparse
+import dataclasses
+import gzip
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1"
+TIMEZONES = ("Asia/Tokyo", "Asia/Taipei", "Europe/Berlin", "America/New_York", "UTC")
+RECURRENCES = (
+    ["RRULE:FREQ=WEEKLY;COUNT=5"],
+    ["RRULE:FREQ=MONTHLY;BYMONTHDAY=1"],
+    ["RRULE:FREQ=DAILY;UNTIL=20240501T000000Z", "EXDATE:20240410T000000Z"],
+)
+# 2010-01-01T00:00:00Z, the start of the synthetic calendars
+EPOCH_START = 1262304000000
+HOUR = 3600 * 1000
+DAY = 24 * HOUR
+
+
+@dataclasses.dataclass
+class FakeServerConfig:
+    """Behaviour of the fake server"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    email: str = "user@example.com"
+    password: str = "password"
+    calendars: int = 1
+    events: int = 1000
+    chunk_size: int = 300
+    latency: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+def make_event(calendar_id: int, index: int, seed: int = 0) -> dict:
+    """Generate the index-th synthetic event of a calendar, deterministically."""
+    rng = random.Random(f"{seed}-{calendar_id}-{index}")
+    all_day = rng.random() < 0.2
+    start_at = EPOCH_START + index * 6 * HOUR + rng.randrange(0, 4) * HOUR
+    timezone = rng.choice(TIMEZONES)
+    created_at = start_at - rng.randrange(1, 30) * DAY
+    has_location = rng.random() < 0.3
+    return {
+        "id": index + 1,
+        "calendar_id": calendar_id,
+        "uuid": str(uuid.UUID(int=rng.getrandbits(128))).replace("-", ""),
+        "title": f"Event {index}",
+        "created_at": created_at,
+        "updated_at": created_at + rng.randrange(0, 3) * HOUR,
+        "note": "Synthetic note\nwith two lines" if rng.random() < 0.3 else "",
+        "location": "Somewhere, 1-2-3" if has_location else "",
+        "location_lat": "35.6812" if has_location else None,
+        "location_lon": "139.7671" if has_location else None,
+        "url": "https://example.com" if rng.random() < 0.1 else "",
+        "start_at": start_at,
+        "start_timezone": timezone,
+        "end_at": start_at + (DAY - 1000 if all_day else HOUR),
+        "end_timezone": timezone,
+        "all_day": all_day,
+        "alerts": rng.choice([None, [15], [15, 60]]),
+        "recurrences": rng.choice([None, None, None, *RECURRENCES]),
+        "parent_id": "",
+        "type": 1 if rng.random() < 0.02 else 0,
+        "category": 2 if rng.random() < 0.02 else 1,
+        "label_id": rng.randrange(1, 10),
+        "deactivated_at": None,
+    }
+
+
+class FakeTimeTreeHandler(BaseHTTPRequestHandler):
+    """Request handler of the fake TimeTree API"""
+
+    server: "FakeTimeTreeServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        """Send a JSON response, gzip compressed if the client accepts it."""
+        data = json.dumps(body).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def prepare(self) -> bool:
+        """Apply latency and error injection. Return False if an error was sent."""
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency)
+        if config.error_rate and self.server.rng.random() < config.error_rate:
+            self.server.count("errors")
+            self.send_json(503, {"error": "injected"}, {"Retry-After": "0"})
+            return False
+        return True
+
+    def authorized(self) -> bool:
+        """Check the session cookie, sending a 401 response if it is invalid."""
+        cookies = self.headers.get("Cookie", "")
+        match = re.search(r"_session_id=([0-9a-f]+)", cookies)
+        if match is None or match.group(1) not in self.server.sessions:
+            self.send_json(401, {"error": "unauthorized"})
+            return False
+        return True
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Handle the sign-in endpoint."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlsplit(self.path).path != f"{API_PREFIX}/auth/email/signin":
+            self.send_json(404, {"error": "not found"})
+            return
+        self.server.count("logins")
+        payload = json.loads(body or b"{}")
+        config = self.server.config
+        if payload.get("uid") != config.email or payload.get("password") != (
+            config.password
+        ):
+            self.send_json(401, {"error": "invalid credentials"})
+            return
+        session_id = uuid.uuid4().hex
+        self.server.sessions.add(session_id)
+        self.send_json(
+            200, {"user": {"id": 1}}, {"Set-Cookie": f"_session_id={session_id}"}
+        )
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle the calendar metadata and events sync endpoints."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if not self.prepare() or not self.authorized():
+            return
+
+        if url.path == f"{API_PREFIX}/calendars":
+            self.server.count("metadata")
+            self.send_json(200, {"calendars": self.server.calendars()})
+            return
+
+        match = re.fullmatch(rf"{API_PREFIX}/calendar/(\d+)/events/sync", url.path)
+        if (
+            match is None
+            or not 1 <= int(match.group(1)) <= self.server.config.calendars
+        ):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        self.server.count("chunks")
+        since = int(query.get("since", ["0"])[0])
+        self.send_json(200, self.server.sync_chunk(int(match.group(1)), since))
+
+
+class FakeTimeTreeServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server emulating the TimeTree API.
+    The sync cursor is the index of the next event to send.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: FakeServerConfig = None, port: int = 0):
+        super().__init__(("127.0.0.1", port), FakeTimeTreeHandler)
+        self.config = config or FakeServerConfig()
+        self.rng = random.Random(self.config.seed)
+        self.sessions = set()
+        self.stats = {"logins": 0, "metadata": 0, "chunks": 0, "errors": 0}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_uri(self) -> str:
+        """Return the base URI of the API served."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def count(self, stat: str):
+        """Increment a request counter."""
+        with self.lock:
+            self.stats[stat] += 1
+
+    def calendars(self) -> list:
+        """Return the metadata of the synthetic calendars."""
+        return [
+            {
+                "id": calendar_id,
+                "name": f"Calendar {calendar_id}",
+                "alias_code": f"fake{calendar_id}",
+                "deactivated_at": None,
+            }
+            for calendar_id in range(1, self.config.calendars + 1)
+        ]
+
+    def sync_chunk(self, calendar_id: int, since: int) -> dict:
+        """Return the sync chunk of the calendar starting at the cursor."""
+        end = min(since + self.config.chunk_size, self.config.events)
+        events = [
+            make_event(calendar_id, index, self.config.seed)
+            for index in range(since, end)
+        ]
+        return {
+            "events": events,
+            "since": max(end, since),
+            "chunk": end < self.config.events,
+        }
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Add the options of FakeServerConfig to the argument parser."""
+    parser.add_argument("--calendars", type=int, default=1, help="Number of calendars")
+    parser.add_argument(
+        "--events", type=int, default=1000, help="Number of events per calendar"
+    )
+    parser.add_argument(
+        "--chunk_size", type=int, default=300, help="Number of events per sync chunk"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Delay of every request in seconds"
+    )
+    parser.add_argument(
+        "--error_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with a transient 503 error",
+    )
+
+
+def config_from_args(args: argparse.Namespace) -> FakeServerConfig:
+    """Create the FakeServerConfig from the parsed arguments."""
+    return FakeServerConfig(
+        calendars=args.calendars,
+        events=args.events,
+        chunk_size=args.chunk_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+
+
+def main():
+    """Run the fake server until interrupted."""
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the TimeTree API",
+        prog="timetree_exporter.fake_server",
+    )
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    server = FakeTimeTreeServer(config, args.port)
+    print(f"Serving the fake TimeTree API at {server.base_uri}")
+    print(f"Log in with {config.email} / {config.password}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+This module filters raw TimeTree events before they are converted.
+
+An EventFilter declares the events to export: by type, category, label, time
+window, last modification and title. It is evaluated directly on the JSON
+events, so that excluded events are dropped before any event object is built
+or any timezone conversion is done. Events that can't be exported (birthdays
+and memos) are always dropped.
+"""
+
+import dataclasses
+import datetime
+import logging
+import re
+from typing import Iterable, Iterator, Optional, Pattern
+
+from timetree_exporter.event import (
+    CATEGORY_MAP,
+    TimeTreeEventCategory,
+    TimeTreeEventType,
+    label_to_int,
+)
+
+logger = logging.getLogger(__name__)
+
+# End of the span of recurring events, which may repeat forever
+END_OF_TIME = 2**63 - 1
+
+
+def time_span(start_at: int, end_at: int = None, recurrences: list = None) -> tuple:
+    """
+    Return the half-open span [start, end) in milliseconds of an event starting
+    and ending at the timestamps, with the recurrences. Events without a
+    duration span one millisecond, recurring events never end.
+    """
+    end = end_at if end_at is not None else start_at
+    if recurrences and any(
+        recurrence.upper().startswith(("RRULE", "RDATE")) for recurrence in recurrences
+    ):
+        end = END_OF_TIME
+    return start_at, max(end, start_at + 1)
+
+
+@dataclasses.dataclass
+class EventFilter:
+    """
+    Conditions an event must meet to be exported. Conditions left to None
+    match every event. The time window [start, end) and updated_since are
+    timestamps in milliseconds.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    event_types: Optional[frozenset] = None
+    categories: Optional[frozenset] = None
+    labels: Optional[frozenset] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+    updated_since: Optional[int] = None
+    title: Optional[Pattern] = None
+    skip_unsupported: bool = True
+
+    def __post_init__(self):
+        if isinstance(self.title, str):
+            self.title = re.compile(self.title)
+
+    def rejection(self, event: dict) -> Optional[str]:
+        """Return why the event is excluded, or None if it is exported."""
+        # pylint: disable=too-many-return-statements
+        event_type = event.get("type")
+        category = event.get("category")
+        if self.skip_unsupported:
+            if event_type == TimeTreeEventType.BIRTHDAY:
+                return "birthday"
+            if category == TimeTreeEventCategory.MEMO:
+                return "memo"
+        if self.event_types is not None and event_type not in self.event_types:
+            return "type"
+        if self.categories is not None and category not in self.categories:
+            return "category"
+        if (
+            self.labels is not None
+            and label_to_int(event.get("label_id")) not in self.labels
+        ):
+            return "label"
+        if (
+            self.updated_since is not None
+            and (event.get("updated_at") or 0) < self.updated_since
+        ):
+            return "updated_at"
+        if self.start is not None or self.end is not None:
+            if event.get("start_at") is None:
+                return "window"
+            start, end = time_span(
+                event["start_at"], event.get("end_at"), event.get("recurrences")
+            )
+            if (self.end is not None and start >= self.end) or (
+                self.start is not None and end <= self.start
+            ):
+                return "window"
+        if self.title is not None and not self.title.search(event.get("title") or ""):
+            return "title"
+        return None
+
+    def __call__(self, event: dict) -> bool:
+        """Return whether the event is exported."""
+        return self.rejection(event) is None
+
+
+def filter_events(
+    events: Iterable[dict], event_filter: EventFilter = None, counts: dict = None
+) -> Iterator[dict]:
+    """
+    Yield the JSON events accepted by the filter, counting the others as
+    "filtered". By default only the events that can't be exported are dropped.
+    """
+    if event_filter is None:
+        event_filter = EventFilter()
+    if counts is None:
+        counts = {}
+    counts.setdefault("filtered", 0)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for event in events:
+        reason = event_filter.rejection(event)
+        if reason is None:
+            yield event
+            continue
+        counts["filtered"] += 1
+        if debug:
+            logger.debug("Skipping event %s (%s)", event.get("uuid"), reason)
+
+
+def parse_window_bound(value: str, is_end: bool = False) -> int:
+    """
+    Parse a date (YYYY-MM-DD) or ISO 8601 date and time in the local timezone
+    to milliseconds. A date given as the end of a window includes the whole day.
+    """
+    parsed = datetime.datetime.fromisoformat(value)
+    if is_end and len(value) == len("YYYY-MM-DD"):
+        parsed += datetime.timedelta(days=1)
+    return int(parsed.timestamp() * 1000)
+
+
+def parse_label(value: str) -> int:
+    """Parse a label given by number (1-9) or by color name, e.g. "teal"."""
+    names = {name: label_id for label_id, name in CATEGORY_MAP.items()}
+    if value.lower() in names:
+        return names[value.lower()]
+    label_id = label_to_int(value)
+    if label_id is None:
+        raise ValueError(f"Unknown label: {value}")
+    return label_id
@@ -5,20 +5,59 @@ for formatting TimeTree events into iCalendar format.
 
 import logging
 from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+from functools import lru_cache
 from icalendar import Event, vRecur, vDate, vDatetime, vGeo, Alarm
 from icalendar.prop import vDDDLists
-from icalendar.parser import Contentline
+from icalendar.parser import Contentline, Parameters
 from timetree_exporter.event import (
     TimeTreeEvent,
     TimeTreeEventType,
     TimeTreeEventCategory,
 )
-from timetree_exporter.utils import convert_timestamp_to_datetime
-
+from timetree_exporter.tz import registry
 
 logger = logging.getLogger(__name__)
 
+# Number of distinct recurrence lines kept parsed
+RECURRENCE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=RECURRENCE_CACHE_SIZE)
+def parse_recurrence_parts(recurrence: str) -> tuple:
+    """Parse a recurrence line of a TimeTree event into its name, value and parameters.
+
+    Calendars repeat the same few rules across many events, so the results are
+    cached. They are shared between events and therefore immutable: the value
+    is a tuple of (key, values) pairs for a rule or a tuple of dates for a date
+    list, and the parameters a tuple of (name, value) pairs. The hit and miss
+    counters are available from parse_recurrence_parts.cache_info().
+    """
+    contentline = Contentline(recurrence)
+    name, parameters, value = contentline.parts()
+    parameters = tuple(parameters.items())
+    if name.lower() == "rrule":
+        rule = tuple(
+            (key, tuple(values)) for key, values in vRecur.from_ical(value).items()
+        )
+        return name, rule, parameters
+    if name.lower() == "exdate" or name.lower() == "rdate":
+        return name, tuple(vDDDLists.from_ical(value)), parameters
+    logger.error("Unknown recurrence type: %s", name)
+    raise ValueError(f"Unknown recurrence type: {name}")
+
+
+def parse_recurrence(recurrence: str) -> tuple:
+    """
+    Return the name, value and parameters of a recurrence line, as new
+    icalendar objects that the event they are added to may modify.
+    """
+    name, value, parameters = parse_recurrence_parts(recurrence)
+    if name.lower() == "rrule":
+        value = vRecur({key: list(values) for key, values in value})
+    else:
+        value = list(value)
+    return name, value, Parameters(parameters)
+
 
 class ICalEventFormatter:
     """
@@ -41,20 +80,12 @@ class ICalEventFormatter:
     @property
     def created(self):
         """Return the creation time of the event."""
-        return vDatetime(
-            convert_timestamp_to_datetime(
-                self.time_tree_event.created_at / 1000, ZoneInfo("UTC")
-            )
-        )
+        return vDatetime(registry.to_datetime(self.time_tree_event.created_at, "UTC"))
 
     @property
     def last_modified(self):
         """Return the last modification time of the event."""
-        return vDatetime(
-            convert_timestamp_to_datetime(
-                self.time_tree_event.updated_at / 1000, ZoneInfo("UTC")
-            )
-        )
+        return vDatetime(registry.to_datetime(self.time_tree_event.updated_at, "UTC"))
 
     @property
     def description(self):
@@ -112,20 +143,14 @@ class ICalEventFormatter:
             timezone = self.time_tree_event.end_timezone
 
         if self.time_tree_event.all_day:
-            dt = convert_timestamp_to_datetime(
-                time / 1000,
-                ZoneInfo(timezone),
-            )
+            dt = registry.to_datetime(time, timezone)
             # For all-day events, end date is exclusive in iCalendar (RFC 5545)
             # So we need to add 1 day to the end date
             if not is_start_time:
                 dt = dt + timedelta(days=1)
             return vDate(dt)
         return vDatetime(
-            convert_timestamp_to_datetime(
-                time / 1000,
-                ZoneInfo(timezone),
-            ),
+            registry.to_datetime(time, timezone),
             params={"TZID": timezone} if timezone != "UTC" else {},
         )
 
@@ -158,47 +183,43 @@ class ICalEventFormatter:
         if self.time_tree_event.recurrences is None:
             return
         for recurrence in self.time_tree_event.recurrences:
-            contentline = Contentline(recurrence)
-            name, parameters, value = contentline.parts()
-            if name.lower() == "rrule":
-                event.add(name, vRecur.from_ical(value), parameters)
-            elif name.lower() == "exdate" or name.lower() == "rdate":
-                event.add(name, vDDDLists.from_ical(value), parameters)
-            else:
-                logger.error("Unknown recurrence type: %s", name)
-                raise ValueError(f"Unknown recurrence type: {name}")
+            name, value, parameters = parse_recurrence(recurrence)
+            event.add(name, value, parameters)
 
     def to_ical(self) -> Event:
         """Return the iCal event."""
         if (
             self.time_tree_event.event_type == TimeTreeEventType.BIRTHDAY
         ):  # Skip if event is a birthday
-            logger.debug(
-                "Skipping birthday event\n \
+            # Only compute the times when they are logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Skipping birthday event\n \
                     uid: %s \n \
                     summary: '%s' \n \
                     time: %s ~ %s \n \
                     ",
-                self.uid,
-                self.summary,
-                self.dtstart.dt.strftime("%Y-%m-%d %H:%M:%S"),
-                self.dtend.dt.strftime("%Y-%m-%d %H:%M:%S"),
-            )
+                    self.uid,
+                    self.summary,
+                    self.dtstart.dt.strftime("%Y-%m-%d %H:%M:%S"),
+                    self.dtend.dt.strftime("%Y-%m-%d %H:%M:%S"),
+                )
 
             return None
         if self.time_tree_event.category == TimeTreeEventCategory.MEMO:
             # Skip if event is a memo
-            logger.debug(
-                "Skipping memo event\n \
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Skipping memo event\n \
                     uid: %s \n \
                     summary: '%s' \n \
                     time: %s ~ %s \n \
                     ",
-                self.uid,
-                self.summary,
-                self.dtstart.dt.strftime("%Y-%m-%d %H:%M:%S"),
-                self.dtend.dt.strftime("%Y-%m-%d %H:%M:%S"),
-            )
+                    self.uid,
+                    self.summary,
+                    self.dtstart.dt.strftime("%Y-%m-%d %H:%M:%S"),
+                    self.dtend.dt.strftime("%Y-%m-%d %H:%M:%S"),
+                )
 
             return None
 
@@ -206,7 +227,7 @@ class ICalEventFormatter:
 
         event.add("uid", self.uid)
         event.add("summary", self.summary)
-        event.add("dtstamp", datetime.now(ZoneInfo("UTC")))
+        event.add("dtstamp", datetime.now(registry.zone("UTC")))
         event.add("created", self.created)
         event.add("last-modified", self.last_modified)
         event.add("dtstart", self.dtstart)
@@ -0,0 +1,257 @@
+"""
+This module provides a direct iCalendar (RFC 5545) writer for TimeTree events.
+
+It emits the VEVENT text of an event without building icalendar components,
+producing the same bytes as `ICalEventFormatter(event).to_ical().to_ical()`:
+the same property order, text escaping, line folding, TZID parameters and
+VALARMs. Only the recurrence rules, which are copied from TimeTree, still go
+through the icalendar value types so that they are normalized identically;
+they are cached per distinct line.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, Iterator, Sequence
+
+from icalendar import Event, vDatetime
+from icalendar.parser import escape_char, foldline, param_value
+
+from timetree_exporter.event import (
+    TimeTreeEventCategory,
+    TimeTreeEventType,
+    TimeTreeEventView,
+)
+from timetree_exporter.formatter import RECURRENCE_CACHE_SIZE, parse_recurrence
+from timetree_exporter.tz import (
+    format_local_date,
+    format_local_datetime,
+    format_local_datetimes,
+    registry,
+    split_local,
+)
+from timetree_exporter.utils import iter_batches
+
+logger = logging.getLogger(__name__)
+
+UTC = registry.zone("UTC")
+# Recurrence properties in the order icalendar writes them
+RECURRENCE_ORDER = ("RRULE", "RDATE", "EXDATE")
+# Number of events whose timestamps are converted together
+BATCH_SIZE = 500
+
+
+def text(value: str) -> str:
+    """Escape a TEXT value."""
+    return escape_char(str(value))
+
+
+def format_datetime(dt: datetime) -> str:
+    """Format a datetime as a DATE-TIME value, without the UTC designator."""
+    return (
+        f"{dt.year:04}{dt.month:02}{dt.day:02}"
+        f"T{dt.hour:02}{dt.minute:02}{dt.second:02}"
+    )
+
+
+@lru_cache(maxsize=None)
+def written_in_utc(timezone: str) -> bool:
+    """
+    Return whether icalendar writes times in the timezone with the UTC
+    designator, as it does for the timezones it knows to be equivalent to UTC.
+    """
+    dt = datetime.fromtimestamp(0, registry.zone(timezone))
+    return vDatetime(dt).to_ical().endswith(b"Z")
+
+
+def event_times(events: Sequence) -> list:
+    """
+    Convert the timestamps of many events at once, one pass per timezone.
+    Return (start, end, created, last modified) per event: the wall-clock start
+    and end times in milliseconds, and the formatted UTC DATE-TIME values.
+    """
+    starts = registry.localize(
+        [event.start_at for event in events],
+        [event.start_timezone for event in events],
+    )
+    ends = registry.localize(
+        [event.end_at for event in events], [event.end_timezone for event in events]
+    )
+    # The wall-clock time in UTC is the timestamp itself
+    created = format_local_datetimes(event.created_at for event in events)
+    modified = format_local_datetimes(event.updated_at for event in events)
+    return list(zip(starts, ends, created, modified))
+
+
+def is_exported(event) -> bool:
+    """Return whether the event is exported, birthdays and memos are not."""
+    if event.event_type == TimeTreeEventType.BIRTHDAY:
+        logger.debug("Skipping birthday event %s", event.uuid)
+        return False
+    if event.category == TimeTreeEventCategory.MEMO:
+        logger.debug("Skipping memo event %s", event.uuid)
+        return False
+    return True
+
+
+def format_duration(td: timedelta) -> str:
+    """Format a timedelta as a DURATION value, like icalendar's vDuration."""
+    sign = ""
+    if td.days < 0:
+        sign = "-"
+        td = -td
+    timepart = ""
+    if td.seconds:
+        hours = td.seconds // 3600
+        minutes = td.seconds % 3600 // 60
+        seconds = td.seconds % 60
+        timepart = "T"
+        if hours:
+            timepart += f"{hours}H"
+        if minutes or (hours and seconds):
+            timepart += f"{minutes}M"
+        if seconds:
+            timepart += f"{seconds}S"
+    if td.days == 0 and timepart:
+        return f"{sign}P{timepart}"
+    return f"{sign}P{abs(td.days)}D{timepart}"
+
+
+def alarm_lines(alert) -> list:
+    """Return the content lines of the VALARM of an alert in minutes."""
+    return [
+        "BEGIN:VALARM",
+        "ACTION:DISPLAY",
+        "DESCRIPTION:Reminder",
+        f"TRIGGER:{format_duration(timedelta(minutes=-alert))}",
+        "END:VALARM",
+    ]
+
+
+@lru_cache(maxsize=RECURRENCE_CACHE_SIZE)
+def recurrence_lines(recurrence: str) -> tuple:
+    """
+    Return the property name, the content line and the TZIDs of a recurrence
+    copied from TimeTree, normalized by icalendar. Results are cached like
+    those of parse_recurrence_parts.
+    """
+    name, value, parameters = parse_recurrence(recurrence)
+    event = Event()
+    event.add(name, value, parameters)
+    name = name.upper()
+    line = str(event.content_line(name, event[name]))
+    tzids = frozenset()
+    if "TZID" in event[name].params:
+        tzids = frozenset([event[name].params["TZID"]])
+    return name, line, tzids
+
+
+class ICalEventWriter:
+    """
+    Writes TimeTree events as VEVENT text. Events that ICalEventFormatter
+    skips (birthdays and memos) are skipped too.
+    """
+
+    def __init__(self, dtstamp: datetime = None):
+        # Defaults to the time each event is written, like ICalEventFormatter
+        self.dtstamp = dtstamp
+
+    def datetime_line(
+        self, name: str, event, is_start_time: bool, local: int, tzids: set
+    ) -> str:
+        """Return the DTSTART or DTEND content line from the wall-clock time."""
+        timezone = event.start_timezone if is_start_time else event.end_timezone
+        if event.all_day:
+            days = split_local(local)[0]
+            # For all-day events, end date is exclusive in iCalendar (RFC 5545)
+            if not is_start_time:
+                days += 1
+            return f"{name};VALUE=DATE:{format_local_date(days)}"
+        if timezone == "UTC":
+            return f"{name}:{format_local_datetime(local)}Z"
+        tzids.add(timezone)
+        value = format_local_datetime(local)
+        if written_in_utc(timezone):
+            value += "Z"
+        return f"{name};TZID={param_value(timezone)}:{value}"
+
+    def recurrence_lines(self, event, tzids: set) -> list:
+        """Return the RRULE, RDATE and EXDATE content lines of the event."""
+        recurrences = {name: [] for name in RECURRENCE_ORDER}
+        for recurrence in event.recurrences:
+            name, line, recurrence_tzids = recurrence_lines(recurrence)
+            recurrences[name].append(line)
+            tzids |= recurrence_tzids
+        return [line for name in RECURRENCE_ORDER for line in recurrences[name]]
+
+    def to_ical(self, event, times: tuple = None) -> tuple:
+        """
+        Return the VEVENT bytes of the event and the TZIDs it uses,
+        or None if the event is not exported. The times of the event can be
+        given as precomputed by event_times.
+        """
+        if not is_exported(event):
+            return None
+        start, end, created, modified = times or event_times([event])[0]
+
+        tzids = set()
+        dtstamp = self.dtstamp or datetime.now(UTC)
+        lines = [
+            "BEGIN:VEVENT",
+            f"SUMMARY:{text(event.title)}",
+            self.datetime_line("DTSTART", event, True, start, tzids),
+            self.datetime_line("DTEND", event, False, end, tzids),
+            f"DTSTAMP:{format_datetime(dtstamp.astimezone(UTC))}Z",
+            f"UID:{text(event.uuid)}",
+        ]
+
+        if event.recurrences is not None:
+            lines.extend(self.recurrence_lines(event, tzids))
+
+        # The other properties follow in alphabetical order
+        category = event.get_ical_category()
+        if category:
+            lines.append(f"CATEGORIES:{text(category)}")
+        color = event.get_ical_color()
+        if color:
+            lines.append(f"COLOR:{text(color)}")
+        lines.append(f"CREATED:{created}Z")
+        if event.note:
+            lines.append(f"DESCRIPTION:{text(event.note)}")
+        if event.location_lat is not None and event.location_lon is not None:
+            lines.append(f"GEO:{float(event.location_lat)};{float(event.location_lon)}")
+        lines.append(f"LAST-MODIFIED:{modified}Z")
+        if event.location:
+            lines.append(f"LOCATION:{text(event.location)}")
+        if event.parent_id:
+            lines.append(f"RELATED-TO:{text(event.parent_id)}")
+        if event.url:
+            lines.append(f"URL:{event.url}")
+
+        for alert in event.alerts or ():
+            lines.extend(alarm_lines(alert))
+        lines.append("END:VEVENT")
+
+        ical = "\r\n".join(map(foldline, lines)) + "\r\n"
+        return ical.encode("UTF-8"), tzids
+
+
+def serialize_events_direct(
+    events: Iterable[dict], counts: dict = None, dtstamp: datetime = None
+) -> Iterator[tuple]:
+    """
+    Serialize TimeTree events with ICalEventWriter, yielding their bytes and
+    the TZIDs they use, and skipping the unsupported ones.
+    """
+    if counts is None:
+        counts = {}
+    counts.setdefault("read", 0)
+    counts.setdefault("converted", 0)
+    writer = ICalEventWriter(dtstamp)
+    for batch in iter_batches(events, BATCH_SIZE):
+        counts["read"] += len(batch)
+        # Skip events before converting the timestamps of the batch at once
+        views = [view for view in map(TimeTreeEventView, batch) if is_exported(view)]
+        for view, times in zip(views, event_times(views)):
+            counts["converted"] += 1
+            yield writer.to_ical(view, times)
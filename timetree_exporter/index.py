@@ -0,0 +1,147 @@
+"""
+This module provides EventIndex, an interval index over the time span of events.
+
+The index is a static centered interval tree built once over the start_at/end_at
+timestamps (milliseconds) of the events. Range and point queries visit
+O(log n) nodes and return the k matching events in O(log n + k), instead of
+checking every event of the calendar.
+"""
+
+import datetime
+from array import array
+from typing import Iterable
+
+from timetree_exporter.event import TimeTreeEventView
+from timetree_exporter.filters import END_OF_TIME, time_span
+
+
+def event_span(event) -> tuple:
+    """Return the half-open span [start, end) of an event in milliseconds."""
+    return time_span(event.start_at, event.end_at, event.recurrences)
+
+
+class IntervalNode:
+    """Node of the interval tree holding the spans that contain its center"""
+
+    # pylint: disable=too-few-public-methods
+    # pylint: disable=too-many-instance-attributes
+
+    __slots__ = (
+        "center",
+        "starts",
+        "start_positions",
+        "ends",
+        "end_positions",
+        "left",
+        "right",
+    )
+
+    def __init__(self, spans: list):
+        endpoints = sorted(point for span in spans for point in span[:2])
+        # Splitting at the lower median of the endpoints sends some span to
+        # the left or keeps it here (the lowest start is at most the center),
+        # and some span to the right or keeps it here (the highest end is past
+        # it), so both children hold fewer spans. The node itself may hold none.
+        self.center = endpoints[(len(endpoints) - 1) // 2]
+        center = self.center
+        here, left, right = [], [], []
+        for span in spans:
+            if span[1] <= center:
+                left.append(span)
+            elif span[0] > center:
+                right.append(span)
+            else:
+                here.append(span)
+        # Spans containing the center, by ascending start and descending end
+        by_start = sorted(here, key=lambda span: span[0])
+        self.starts = array("q", (span[0] for span in by_start))
+        self.start_positions = array("q", (span[2] for span in by_start))
+        by_end = sorted(here, key=lambda span: span[1], reverse=True)
+        self.ends = array("q", (span[1] for span in by_end))
+        self.end_positions = array("q", (span[2] for span in by_end))
+        self.left = IntervalNode(left) if left else None
+        self.right = IntervalNode(right) if right else None
+
+
+class EventIndex:
+    """
+    Interval index over events with start_at/end_at attributes, such as
+    TimeTreeEvent or TimeTreeEventView.
+    """
+
+    def __init__(self, events: Iterable):
+        self.events = list(events)
+        spans = [
+            (*event_span(event), position)
+            for position, event in enumerate(self.events)
+            if event.start_at is not None
+        ]
+        self.root = IntervalNode(spans) if spans else None
+
+    @classmethod
+    def from_dicts(cls, events: Iterable[dict]) -> "EventIndex":
+        """Create an index over JSON events"""
+        return cls(map(TimeTreeEventView, events))
+
+    def __len__(self):
+        return len(self.events)
+
+    def positions(self, start: int = None, end: int = None) -> list:
+        """
+        Return the positions of the events overlapping [start, end), in
+        milliseconds, in the order the events were given.
+        """
+        start = -END_OF_TIME if start is None else start
+        end = END_OF_TIME if end is None else end
+        found = []
+        nodes = [self.root] if self.root is not None and start < end else []
+        while nodes:
+            node = nodes.pop()
+            if end <= node.center:
+                for index, span_start in enumerate(node.starts):
+                    if span_start >= end:
+                        break
+                    found.append(node.start_positions[index])
+                if node.left is not None:
+                    nodes.append(node.left)
+            elif start > node.center:
+                for index, span_end in enumerate(node.ends):
+                    if span_end <= start:
+                        break
+                    found.append(node.end_positions[index])
+                if node.right is not None:
+                    nodes.append(node.right)
+            else:
+                found.extend(node.start_positions)
+                nodes.extend(child for child in (node.left, node.right) if child)
+        found.sort()
+        return found
+
+    def overlapping(self, start: int = None, end: int = None) -> list:
+        """Return the events overlapping [start, end), in milliseconds."""
+        return [self.events[position] for position in self.positions(start, end)]
+
+    def at(self, timestamp: int) -> list:
+        """Return the events taking place at the timestamp in milliseconds."""
+        return self.overlapping(timestamp, timestamp + 1)
+
+    def on_date(self, date: datetime.date, tzinfo: datetime.tzinfo = None) -> list:
+        """Return the events taking place on the date, in the local timezone by default."""
+        start, end = (
+            int(
+                datetime.datetime.combine(day, datetime.time(), tzinfo).timestamp()
+                * 1000
+            )
+            for day in (date, date + datetime.timedelta(days=1))
+        )
+        return self.overlapping(start, end)
+
+
+def select_window(events: Iterable[dict], start: int = None, end: int = None) -> list:
+    """Return the JSON events overlapping [start, end), in milliseconds."""
+    if start is None and end is None:
+        return list(events)
+    return [
+        view.event_data
+        for view in EventIndex.from_dicts(events).overlapping(start, end)
+    ]
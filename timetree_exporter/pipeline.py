@@ -0,0 +1,333 @@
+"""
+This module provides the staged export pipeline.
+
+Fetching, conversion and serialization each run in their own thread, connected
+by bounded queues: a stage blocks when its consumer falls behind, so network
+waits overlap with CPU work without buffering the whole calendar.
+"""
+
+import gzip
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from icalendar import Calendar, Event
+
+from timetree_exporter import __version__
+from timetree_exporter.event import TimeTreeEventView
+from timetree_exporter.formatter import ICalEventFormatter
+from timetree_exporter.ics import serialize_events_direct
+from timetree_exporter.tz import vtimezones
+from timetree_exporter.utils import FLUSH, iter_batches, new_file_mode
+
+logger = logging.getLogger(__name__)
+
+# Default capacity of the queues between the stages
+QUEUE_SIZE = 1000
+# Number of events sent to a worker process at once
+JOB_BATCH_SIZE = 1000
+CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+
+
+class StageError:
+    """Wrapper passing an exception raised in a stage to its consumer"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+STAGE_DONE = object()
+
+
+def pipelined(items: Iterable, maxsize: int = QUEUE_SIZE) -> Iterator:
+    """
+    Iterate over items in a background thread, handing them over through a
+    bounded queue. Exceptions raised by the stage are re-raised to the consumer.
+    """
+    handover = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # Give up if the consumer has gone away instead of blocking forever
+        while not stopped.is_set():
+            try:
+                handover.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            put(StageError(exc))
+            return
+        finally:
+            # Stop the upstream stages too if the consumer has gone away
+            if hasattr(items, "close"):
+                items.close()
+        put(STAGE_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handover.get()
+            if item is STAGE_DONE:
+                return
+            if isinstance(item, StageError):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
+
+
+def convert_events(events: Iterable[dict], counts: dict = None) -> Iterator[Event]:
+    """Convert TimeTree events to iCal events, skipping the unsupported ones."""
+    if counts is None:
+        counts = {}
+    counts.setdefault("read", 0)
+    counts.setdefault("converted", 0)
+    for event_data in events:
+        if event_data is FLUSH:
+            continue
+        counts["read"] += 1
+        # Wrap the JSON event instead of copying it, skipped events are only
+        # looked at briefly
+        ical_event = ICalEventFormatter(TimeTreeEventView(event_data)).to_ical()
+        if ical_event is None:
+            continue
+        counts["converted"] += 1
+        yield ical_event
+
+
+def used_tzids(component) -> set:
+    """Return the TZIDs referenced by the properties of the component."""
+    tzids = set()
+    for _, value in component.property_items(sorted=False):
+        if hasattr(value, "params") and "TZID" in value.params:
+            tzids.add(value.params["TZID"])
+    return tzids
+
+
+def serialize_events(ical_events: Iterable[Event]) -> Iterator[tuple]:
+    """Serialize iCal events, yielding their bytes and the TZIDs they use."""
+    for ical_event in ical_events:
+        yield ical_event.to_ical(), used_tzids(ical_event)
+
+
+def serialize_batch(events: list, serializer: str = "icalendar") -> tuple:
+    """
+    Convert and serialize a batch of TimeTree events in a worker process.
+    Return the serialized events and the counts of read and converted events.
+    """
+    counts = {}
+    if serializer == "direct":
+        serialized = list(serialize_events_direct(events, counts))
+    else:
+        serialized = list(serialize_events(convert_events(events, counts)))
+    return serialized, counts
+
+
+def process_pool(jobs: int) -> ProcessPoolExecutor:
+    """Return a pool of worker processes for serialize_in_processes."""
+    # Forking while the pipeline threads are running may deadlock the workers
+    return ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("spawn"))
+
+
+def serialize_in_processes(
+    events: Iterable[dict],
+    counts: dict = None,
+    serializer: str = "icalendar",
+    jobs: int = 2,
+    executor: Executor = None,
+) -> Iterator[tuple]:
+    """
+    Convert and serialize TimeTree events in batches on a pool of worker
+    processes, yielding the serialized events in their original order. At most
+    two batches per job are in flight, so memory use stays bounded. A pool of
+    the given number of jobs is created unless one is given.
+    """
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    if counts is None:
+        counts = {}
+    counts.setdefault("read", 0)
+    counts.setdefault("converted", 0)
+    own_executor = executor is None
+    if own_executor:
+        executor = process_pool(jobs)
+    batches = iter_batches(events, JOB_BATCH_SIZE)
+    pending = deque()
+    try:
+        while True:
+            flushed = False
+            while len(pending) < 2 * jobs and not flushed:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                if batch:
+                    pending.append(executor.submit(serialize_batch, batch, serializer))
+                # A batch cut short by a flush is handed over with the ones
+                # before it, without waiting for more events
+                flushed = len(batch) < JOB_BATCH_SIZE
+            if batch is None and not pending:
+                return
+            for _ in range(len(pending) if flushed else 1):
+                serialized, batch_counts = pending.popleft().result()
+                counts["read"] += batch_counts["read"]
+                counts["converted"] += batch_counts["converted"]
+                yield from serialized
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def export_events(
+    events: Iterable[dict],
+    counts: dict = None,
+    maxsize: int = QUEUE_SIZE,
+    serializer: str = "icalendar",
+    jobs: int = 1,
+    executor: Executor = None,
+) -> Iterator[tuple]:
+    """
+    Run the fetch, conversion and serialization stages of the events
+    concurrently, yielding the serialized events in order.
+
+    The "direct" serializer writes the events with ICalEventWriter instead of
+    building icalendar components, in a single stage. With more than one job,
+    conversion and serialization are spread over worker processes, taken from
+    the executor if one is given.
+    """
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    fetched = pipelined(events, maxsize)
+    if jobs > 1:
+        return pipelined(
+            serialize_in_processes(fetched, counts, serializer, jobs, executor),
+            maxsize,
+        )
+    if serializer == "direct":
+        return pipelined(serialize_events_direct(fetched, counts), maxsize)
+    converted = pipelined(convert_events(fetched, counts), maxsize)
+    return pipelined(serialize_events(converted), maxsize)
+
+
+def calendar_header() -> bytes:
+    """Return the beginning of the VCALENDAR, up to the first component."""
+    cal = Calendar()
+    cal.add("prodid", f"-//TimeTree Exporter {__version__}//EN")
+    cal.add("version", "2.0")
+    return cal.to_ical()[: -len(CALENDAR_FOOTER)]
+
+
+def timezones_to_ical(tzids: Iterable[str]) -> bytes:
+    """Return the VTIMEZONE components of the TZIDs known to zoneinfo."""
+    return vtimezones.to_ical(tzids)
+
+
+@contextmanager
+def open_output(path: str):
+    """
+    Open the output of the export as a binary file object: standard output
+    for "-", a gzip stream for paths ending in ".gz", or else a plain file.
+    Files are written to a temporary file next to them and only replace the
+    previous output once complete, so a failed export leaves it untouched.
+    """
+    if path == "-":
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+
+    # Path Traversal Vulnerability if on a server
+    tmp_file = tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp", delete=False
+    )
+    try:
+        with tmp_file:
+            if path.endswith(".gz"):
+                with gzip.GzipFile(filename=path, mode="wb", fileobj=tmp_file) as f:
+                    yield f
+            else:
+                yield tmp_file
+        os.chmod(tmp_file.name, new_file_mode(path))
+        os.replace(tmp_file.name, path)
+    except BaseException:
+        os.unlink(tmp_file.name)
+        raise
+
+
+class ICalStreamWriter:
+    """
+    Streams an iCal calendar to a binary file object: the header on entering,
+    each event as soon as it is written, then the timezones of the written
+    events and the footer on exit. Only the set of TZIDs is kept in memory.
+    Events may be written from several threads.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.tzids = set()
+        self.count = 0
+        # Number of bytes written so far
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> "ICalStreamWriter":
+        header = calendar_header()
+        self.output.write(header)
+        self.position = len(header)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leave an interrupted calendar unterminated rather than look complete
+        if exc_type is None:
+            self.output.write(timezones_to_ical(self.tzids))
+            self.output.write(CALENDAR_FOOTER)
+            self.output.flush()
+
+    def write(self, ical_bytes: bytes, tzids: Iterable[str]) -> int:
+        """
+        Write a serialized event and record the timezones it uses.
+        Return the offset of the event in the output.
+        """
+        with self.lock:
+            offset = self.position
+            self.output.write(ical_bytes)
+            self.position += len(ical_bytes)
+            self.tzids.update(tzids)
+            self.count += 1
+        return offset
+
+    def write_all(self, serialized_events: Iterable[tuple]) -> int:
+        """Write serialized events as they are produced. Return their number."""
+        count = 0
+        for ical_bytes, tzids in serialized_events:
+            self.write(ical_bytes, tzids)
+            count += 1
+        return count
+
+
+def write_ical(output, serialized_events: Iterable[tuple]) -> int:
+    """
+    Write a complete iCal calendar of the serialized events to a binary file
+    object, followed by the timezones they use. Return the number of events.
+    """
+    with ICalStreamWriter(output) as writer:
+        return writer.write_all(serialized_events)
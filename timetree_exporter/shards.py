@@ -0,0 +1,204 @@
+"""
+This module splits the exported events into several iCal files (shards).
+
+Events are assigned to a shard by the year or month of their start, in their
+start timezone, or by calendar. Each shard is a complete calendar with the
+timezones used by its events, so that calendar clients can subscribe to the
+shards they need only. A manifest listing the shards is written next to them.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Iterable
+
+from timetree_exporter import __version__
+from timetree_exporter.pipeline import ICalStreamWriter, open_output
+from timetree_exporter.splice import (
+    IncrementalOutput,
+    event_digest,
+    index_path,
+    serialize_spliced,
+)
+from timetree_exporter.tz import EPOCH_ORDINAL, registry, split_local
+from timetree_exporter.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+SHARD_BY = ("year", "month", "calendar")
+# Shard of the events without a start time
+UNDATED = "undated"
+
+
+def split_output_path(output: str) -> tuple:
+    """Split an output path into its root, extension and compression suffix."""
+    root, ext = os.path.splitext(output)
+    compression = ""
+    if ext == ".gz":
+        compression = ext
+        root, ext = os.path.splitext(root)
+    return root, ext or ".ics", compression
+
+
+def shard_path(output: str, key: str) -> str:
+    """Return the path of a shard of the output, e.g. timetree_2024.ics."""
+    root, ext, compression = split_output_path(output)
+    return f"{root}_{key}{ext}{compression}"
+
+
+def manifest_path(output: str) -> str:
+    """Return the path of the manifest of a sharded output."""
+    return f"{split_output_path(output)[0]}.manifest.json"
+
+
+def start_date(event: dict) -> date:
+    """Return the local date of the start of a JSON event, or None."""
+    if event.get("start_at") is None:
+        return None
+    local = registry.local(event["start_at"], event.get("start_timezone") or "UTC")
+    return date.fromordinal(EPOCH_ORDINAL + split_local(local)[0])
+
+
+class ShardedOutput:
+    """
+    iCal files each holding the events of a year, a month or a calendar.
+    Shards are opened when their first event is written, written to by the
+    threads exporting the calendars, and completed in parallel on exit. When
+    updating, each shard is an IncrementalOutput, so that shards whose events
+    have not changed are left untouched.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        output: str,
+        shard_by: str,
+        update: bool = False,
+        serializer: str = "icalendar",
+        workers: int = 4,
+    ):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=too-many-positional-arguments
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"Unknown shard type: {shard_by}")
+        self.output = output
+        self.shard_by = shard_by
+        self.update = update
+        self.serializer = serializer
+        self.workers = workers
+        # key -> (ExitStack closing the shard, writer)
+        self.shards = {}
+        self.lock = threading.Lock()
+
+    def shard_key(self, event: dict, metadata: dict) -> str:
+        """Return the key of the shard of a JSON event of the calendar."""
+        if self.shard_by == "calendar":
+            return metadata["alias_code"]
+        day = start_date(event)
+        if day is None:
+            return UNDATED
+        if self.shard_by == "year":
+            return f"{day.year:04}"
+        return f"{day.year:04}-{day.month:02}"
+
+    def shard(self, key: str):
+        """Return the writer of a shard, opening the shard if needed."""
+        shard = self.shards.get(key)
+        if shard is None:
+            with self.lock:
+                shard = self.shards.get(key)
+                if shard is None:
+                    stack = contextlib.ExitStack()
+                    path = shard_path(self.output, key)
+                    if self.update:
+                        writer = stack.enter_context(
+                            IncrementalOutput(path, self.serializer)
+                        )
+                    else:
+                        writer = stack.enter_context(
+                            ICalStreamWriter(stack.enter_context(open_output(path)))
+                        )
+                    shard = self.shards[key] = (stack, writer)
+        return shard[1]
+
+    def write_all(
+        self, events: Iterable[dict], metadata: dict, counts: dict = None, **options
+    ) -> int:
+        """
+        Write the JSON events of a calendar to their shards, in order. The
+        options are passed to export_events. Return the number of events written.
+        """
+
+        def lookup(event):
+            writer = self.shard(self.shard_key(event, metadata))
+            if not self.update:
+                return (writer, None, None), None
+            uid, digest = event["uuid"], event_digest(event)
+            return (writer, uid, digest), writer.previous_event(uid, digest)
+
+        count = 0
+        for ical_bytes, tzids, (writer, uid, digest) in serialize_spliced(
+            events, lookup, counts, **options
+        ):
+            if self.update:
+                writer.write(ical_bytes, tzids, uid, digest)
+            else:
+                writer.write(ical_bytes, tzids)
+            count += 1
+        return count
+
+    def __enter__(self) -> "ShardedOutput":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            list(
+                executor.map(
+                    lambda shard: shard[0].__exit__(exc_type, exc_value, traceback),
+                    self.shards.values(),
+                )
+            )
+        if exc_type is None:
+            self.remove_stale_shards()
+            self.write_manifest()
+
+    def remove_stale_shards(self):
+        """Remove the shards of the previous export that no longer have events."""
+        try:
+            with open(manifest_path(self.output), encoding="UTF-8") as manifest_file:
+                previous = json.load(manifest_file)["shards"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        directory = os.path.dirname(manifest_path(self.output))
+        for shard in previous:
+            if shard.get("key") in self.shards:
+                continue
+            # Only remove files next to the manifest
+            path = os.path.join(directory, os.path.basename(shard.get("path", "")))
+            for stale_path in (path, index_path(path)):
+                if os.path.isfile(stale_path):
+                    logger.info("Removing the empty shard %s", stale_path)
+                    os.remove(stale_path)
+
+    def write_manifest(self):
+        """Write the list of the shards with their number of events."""
+        write_json_atomic(
+            manifest_path(self.output),
+            {
+                "exporter": __version__,
+                "shard_by": self.shard_by,
+                "shards": [
+                    {
+                        "key": key,
+                        "path": os.path.basename(shard_path(self.output, key)),
+                        "events": self.shards[key][1].count,
+                    }
+                    for key in sorted(self.shards)
+                ],
+            },
+        )
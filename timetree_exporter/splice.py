@@ -0,0 +1,257 @@
+"""
+This module rewrites an existing iCal output file incrementally.
+
+Next to the output file, a sidecar index records for each UID a hash of the
+TimeTree event it was rendered from and where its VEVENT is in the file. On
+the next export, events whose hash has not changed are copied byte for byte
+from the previous file, and only new or changed events are rendered. The new
+file is written next to the old one and moved into place, so that readers
+never see a partially written calendar.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import queue
+import tempfile
+import threading
+from typing import Callable, Iterable, Iterator
+
+from timetree_exporter import __version__
+from timetree_exporter.filters import EventFilter
+from timetree_exporter.pipeline import ICalStreamWriter, export_events, pipelined
+from timetree_exporter.utils import FLUSH, new_file_mode, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Format of the sidecar index, written to INDEX_SUFFIX next to the output
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+VEVENT_BEGIN = b"BEGIN:VEVENT\r\n"
+VEVENT_END = b"END:VEVENT\r\n"
+RENDER_DONE = object()
+
+
+def event_digest(event: dict) -> str:
+    """Return a hash of the content of a JSON event."""
+    content = json.dumps(event, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(content.encode("UTF-8"), digest_size=16).hexdigest()
+
+
+def serialize_spliced(
+    events: Iterable[dict], lookup: Callable, counts: dict = None, **options
+) -> Iterator[tuple]:
+    """
+    Yield the VEVENT bytes, the TZIDs and a tag of the JSON events in order.
+    lookup(event) returns the tag of an event and the event already serialized
+    (VEVENT bytes and TZIDs), or None to render it with export_events, to which
+    the options are passed. Copied events are counted as "spliced".
+    """
+    if counts is None:
+        counts = {}
+    counts.setdefault("spliced", 0)
+    to_render = queue.Queue()
+    supported = EventFilter()
+
+    def render_queue():
+        # The consumer may be waiting for an event the rendering stage holds in
+        # a batch it is still filling, while the classifier is held back by the
+        # consumer. So the batches are flushed whenever the queue runs dry.
+        unflushed = False
+        while True:
+            try:
+                event = to_render.get_nowait()
+            except queue.Empty:
+                if unflushed:
+                    unflushed = False
+                    yield FLUSH
+                event = to_render.get()
+            if event is RENDER_DONE:
+                return
+            unflushed = True
+            yield event
+
+    def classify():
+        # Runs in its own stage, ahead of the consumer
+        try:
+            for event in events:
+                if not supported(event):
+                    continue
+                tag, previous = lookup(event)
+                if previous is None:
+                    to_render.put(event)
+                yield tag, previous
+        finally:
+            to_render.put(RENDER_DONE)
+
+    rendered = export_events(render_queue(), counts, **options)
+    for tag, previous in pipelined(classify()):
+        if previous is not None:
+            counts["spliced"] += 1
+            yield (*previous, tag)
+            continue
+        serialized = next(rendered, None)
+        if serialized is None:
+            raise RuntimeError(f"Event {tag} was not rendered")
+        yield (*serialized, tag)
+    # Raise the errors of the rendering stages, if any
+    for _ in rendered:
+        pass
+
+
+def index_path(path: str) -> str:
+    """Return the path of the sidecar index of an output file."""
+    return f"{path}{INDEX_SUFFIX}"
+
+
+def can_update(path: str) -> bool:
+    """Return whether the output can be updated in place: only plain files can."""
+    return path != "-" and not path.endswith(".gz")
+
+
+class IncrementalOutput:
+    """
+    An iCal output file rewritten from its previous version. Used as a context
+    manager, it writes the new calendar to a temporary file and replaces the
+    output with it on success. The file is left untouched if nothing changed.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path: str, serializer: str = "icalendar"):
+        self.path = path
+        self.serializer = serializer
+        # uid -> [hash, offset, length, tzids] of the previous and new file
+        self.previous = {}
+        self.entries = {}
+        self.data = b""
+        self.changed = False
+        self.lock = threading.Lock()
+        self.writer = None
+        self._file = None
+        self._mmap = None
+        self._tmp_path = None
+
+    def stat_key(self) -> list:
+        """Return what identifies the current version of the output file."""
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def load(self):
+        """Load the index of the previous output if it still describes the file."""
+        try:
+            with open(index_path(self.path), encoding="UTF-8") as index_file:
+                index = json.load(index_file)
+            if index.get("version") != INDEX_VERSION or index.get("exporter") != [
+                __version__,
+                self.serializer,
+            ]:
+                return
+            if index.get("file") != self.stat_key():
+                logger.info("%s has changed since it was exported", self.path)
+                return
+        except (OSError, ValueError, AttributeError):
+            return
+        self.previous = index["events"]
+        self._file = open(self.path, "rb")  # pylint: disable=consider-using-with
+        if os.path.getsize(self.path):
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self._mmap
+
+    def previous_event(self, uid: str, digest: str) -> tuple:
+        """
+        Return the VEVENT bytes and TZIDs of the event in the previous output,
+        or None if the event is new, has changed or can't be found.
+        """
+        entry = self.previous.get(uid)
+        if entry is None or entry[0] != digest:
+            return None
+        _, offset, length, tzids = entry
+        ical_bytes = self.data[offset : offset + length]
+        if not (
+            ical_bytes.startswith(VEVENT_BEGIN) and ical_bytes.endswith(VEVENT_END)
+        ):
+            return None
+        return ical_bytes, frozenset(tzids)
+
+    def __enter__(self) -> "IncrementalOutput":
+        self.load()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        self.writer = ICalStreamWriter(os.fdopen(fd, "wb"))
+        self.writer.__enter__()  # pylint: disable=unnecessary-dunder-call
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tmp_file = self.writer.output
+        try:
+            self.writer.__exit__(exc_type, exc_value, traceback)
+        finally:
+            tmp_file.close()
+            if self._mmap is not None:
+                self._mmap.close()
+            if self._file is not None:
+                self._file.close()
+        if exc_type is not None:
+            os.unlink(self._tmp_path)
+            return
+        if (
+            self._file is not None
+            and not self.changed
+            and set(self.entries) == set(self.previous)
+        ):
+            # Spliced in the same order, the file would be identical
+            os.unlink(self._tmp_path)
+            logger.info("%s is up to date", self.path)
+            return
+        os.chmod(self._tmp_path, new_file_mode(self.path))
+        os.replace(self._tmp_path, self.path)
+        write_json_atomic(
+            index_path(self.path),
+            {
+                "version": INDEX_VERSION,
+                "exporter": [__version__, self.serializer],
+                "file": self.stat_key(),
+                "events": self.entries,
+            },
+        )
+
+    @property
+    def count(self) -> int:
+        """Return the number of events written."""
+        return self.writer.count
+
+    def write(self, ical_bytes: bytes, tzids: Iterable[str], uid: str, digest: str):
+        """Write a VEVENT and record it in the new index."""
+        offset = self.writer.write(ical_bytes, tzids)
+        entry = [digest, offset, len(ical_bytes), sorted(tzids)]
+        with self.lock:
+            previous = self.previous.get(uid)
+            if previous is None or previous[:3] != entry[:3]:
+                self.changed = True
+            self.entries[uid] = entry
+
+    def write_all(self, events: Iterable[dict], counts: dict = None, **options) -> int:
+        """
+        Write the JSON events, copying the unchanged ones from the previous
+        output and rendering the others with export_events, in their original
+        order. The options are passed to export_events. Return the number of
+        events written.
+        """
+        count = 0
+        for ical_bytes, tzids, (uid, digest) in serialize_spliced(
+            events, self.lookup, counts, **options
+        ):
+            self.write(ical_bytes, tzids, uid, digest)
+            count += 1
+        return count
+
+    def lookup(self, event: dict) -> tuple:
+        """
+        Return the UID and hash of a JSON event, with the event as found in the
+        previous output if it has not changed, for serialize_spliced.
+        """
+        uid, digest = event["uuid"], event_digest(event)
+        return (uid, digest), self.previous_event(uid, digest)
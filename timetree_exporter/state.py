@@ -0,0 +1,251 @@
+"""
+This module persists the sync cursor and the fetched events of each calendar
+so that subsequent exports only need to download the changes.
+
+The state of a calendar is a snapshot of its events followed by a log of the
+deltas fetched since, one JSON line per sync. A sync appends its delta to the
+log, and the snapshot is only rewritten (compacted) once the log has grown to
+a fraction of its size, so that writing the state costs time proportional to
+the delta, amortized. Loading the state still reads every stored event, which
+the export needs anyway.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import shutil
+
+from timetree_exporter.api.calendar import SyncChunk
+from timetree_exporter.merge import EventMerge
+from timetree_exporter.utils import get_cache_dir, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# The snapshot is compacted once the log is this large relative to it
+COMPACT_RATIO = 0.5
+
+
+@dataclasses.dataclass
+class SyncState:
+    """Sync cursor and previously fetched events of a calendar"""
+
+    since: int
+    events: list = dataclasses.field(default_factory=list)
+    # uuid -> updated_at of the events deleted since the first sync
+    tombstones: dict = dataclasses.field(default_factory=dict)
+
+
+class SyncStateStore:
+    """
+    File based store of SyncState objects keyed by calendar id.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = get_cache_dir(cache_dir)
+        self.directory = os.path.join(self.cache_dir, "sync")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, calendar_id) -> str:
+        """Return the path of the state snapshot of the calendar."""
+        return os.path.join(self.directory, f"{calendar_id}.json")
+
+    def log_path(self, calendar_id) -> str:
+        """Return the path of the delta log of the calendar."""
+        return os.path.join(self.directory, f"{calendar_id}.log.jsonl")
+
+    def load(self, calendar_id) -> SyncState:
+        """Load the state of the calendar, or None if there is none."""
+        try:
+            with open(self.path(calendar_id), "r", encoding="UTF-8") as state_file:
+                data = json.load(state_file)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError):
+            logger.warning("Ignoring unreadable sync state of calendar %s", calendar_id)
+            return None
+        state = SyncState(
+            since=data["since"],
+            events=data["events"],
+            tombstones=data.get("tombstones", {}),
+        )
+        self.replay_log(calendar_id, state)
+        return state
+
+    def replay_log(self, calendar_id, state: SyncState):
+        """Apply the deltas logged after the snapshot to the state."""
+        try:
+            log_file = open(  # pylint: disable=consider-using-with
+                self.log_path(calendar_id), "r", encoding="UTF-8"
+            )
+        except FileNotFoundError:
+            return
+        merge = None
+        with log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A sync interrupted while appending, its delta is fetched
+                    # again from the last cursor chained below
+                    logger.warning("Ignoring truncated sync log of %s", calendar_id)
+                    continue
+                # Deltas are chained by cursor: skip those already in the snapshot
+                if record["from"] != state.since:
+                    continue
+                if merge is None:
+                    merge = EventMerge(state.events, state.tombstones)
+                merge.apply(record["events"])
+                state.since = record["since"]
+        if merge is not None:
+            state.events = merge.to_list()
+            state.tombstones = merge.tombstones
+
+    def save(self, calendar_id, state: SyncState):
+        """Atomically write the snapshot of the state and clear the log."""
+        write_json_atomic(self.path(calendar_id), dataclasses.asdict(state))
+        self.clear_log(calendar_id)
+
+    def update(self, calendar_id, state: SyncState, since: int, delta: list):
+        """
+        Persist the state reached by applying the delta fetched from the cursor
+        since: append the delta to the log, or compact the log into a new
+        snapshot once it has grown too large.
+        """
+        try:
+            snapshot_size = os.path.getsize(self.path(calendar_id))
+        except OSError:
+            self.save(calendar_id, state)
+            return
+        if not delta and state.since == since:
+            return
+        line = json.dumps(
+            {"from": since, "since": state.since, "events": delta}, ensure_ascii=False
+        )
+        try:
+            log_size = os.path.getsize(self.log_path(calendar_id))
+        except OSError:
+            log_size = 0
+        if log_size + len(line) > COMPACT_RATIO * snapshot_size:
+            logger.debug("Compacting the sync log of calendar %s", calendar_id)
+            self.save(calendar_id, state)
+            return
+        with open(self.log_path(calendar_id), "a", encoding="UTF-8") as log_file:
+            log_file.write(line + "\n")
+
+    def clear_log(self, calendar_id):
+        """Remove the delta log of the calendar."""
+        try:
+            os.unlink(self.log_path(calendar_id))
+        except FileNotFoundError:
+            pass
+
+    def clear(self, calendar_id):
+        """Remove the state of the calendar."""
+        try:
+            os.unlink(self.path(calendar_id))
+        except FileNotFoundError:
+            pass
+        self.clear_log(calendar_id)
+
+
+class ChunkCheckpoint:
+    """
+    On-disk checkpoint of the sync chunks fetched so far for a calendar,
+    used to resume an interrupted fetch from the last completed chunk.
+    """
+
+    def __init__(self, calendar_id, since: int = None, cache_dir: str = None):
+        self.directory = os.path.join(
+            get_cache_dir(cache_dir), "checkpoints", str(calendar_id)
+        )
+        self.since = since
+        self.count = 0
+
+    def chunk_path(self, index: int) -> str:
+        """Return the path of the index-th chunk file."""
+        return os.path.join(self.directory, f"chunk-{index:05d}.json")
+
+    def load(self) -> list:
+        """
+        Load the saved chunks. A checkpoint started from a different sync cursor
+        is discarded, since its chunks do not continue the requested sync.
+        """
+        try:
+            with open(
+                os.path.join(self.directory, "start.json"), "r", encoding="UTF-8"
+            ) as start_file:
+                start = json.load(start_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            start = None
+        if start is None or start["since"] != self.since:
+            self.clear()
+            return []
+
+        chunks = []
+        while True:
+            try:
+                with open(
+                    self.chunk_path(len(chunks)), "r", encoding="UTF-8"
+                ) as chunk_file:
+                    chunks.append(SyncChunk(**json.load(chunk_file)))
+            except FileNotFoundError:
+                break
+        self.count = len(chunks)
+        return chunks
+
+    def save(self, chunk: SyncChunk):
+        """Save the next chunk."""
+        if self.count == 0:
+            os.makedirs(self.directory, exist_ok=True)
+            write_json_atomic(
+                os.path.join(self.directory, "start.json"), {"since": self.since}
+            )
+        write_json_atomic(self.chunk_path(self.count), dataclasses.asdict(chunk))
+        self.count += 1
+
+    def clear(self):
+        """Remove all saved chunks."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.count = 0
+
+
+def sync_events(
+    calendar,
+    calendar_id,
+    store: SyncStateStore,
+    calendar_name=None,
+    checkpoint: bool = False,
+):
+    """
+    Fetch the events of the calendar, downloading only the changes since the
+    last sync recorded in the store, and persist the new state.
+    """
+    state = store.load(calendar_id)
+    if state is None:
+        logger.info("No previous sync state found, fetching all events")
+        state = SyncState(since=None)
+    else:
+        logger.info("Resuming sync from cursor %s", state.since)
+
+    chunk_checkpoint = None
+    if checkpoint:
+        chunk_checkpoint = ChunkCheckpoint(calendar_id, state.since, store.cache_dir)
+
+    # Each chunk is applied as it arrives, in time proportional to its size
+    merge = EventMerge(state.events, state.tombstones)
+    since = state.since
+    delta = []
+    changed = 0
+    for chunk in calendar.iter_event_chunks(
+        calendar_id, calendar_name, state.since, chunk_checkpoint
+    ):
+        delta.extend(chunk.events)
+        changed += merge.apply(chunk.events)
+        state.since = chunk.since
+
+    logger.info("Fetched %d new or updated events, %d changed", len(delta), changed)
+    state.events = merge.to_list()
+    state.tombstones = merge.tombstones
+    store.update(calendar_id, state, since, delta)
+    return state.events
@@ -0,0 +1,337 @@
+"""
+This module provides TimeTreeEventTable, a columnar store of TimeTree events.
+
+Each field is stored in a compact column instead of one Python object per event:
+timestamps in int64 arrays, small integers in int16 arrays (widened to int64
+when a value doesn't fit), timezone names dictionary-encoded, and strings as
+offsets into a single UTF-8 buffer. Columns are backed by the standard library
+`array` module, so filtering and slicing run over flat buffers and rows are
+only materialized on demand as lightweight views that ICalEventFormatter
+accepts in place of a TimeTreeEvent.
+"""
+
+import itertools
+import json
+from array import array
+from typing import Callable, Iterable, Iterator
+
+from timetree_exporter.event import EVENT_FIELDS, TimeTreeEventBase, label_to_int
+
+# Marks a missing value in the integer columns
+INT64_NULL = -(2**63)
+INT16_NULL = -(2**15)
+INT16_MAX = 2**15 - 1
+
+TIMESTAMP_COLUMNS = ("created_at", "updated_at", "start_at", "end_at")
+SMALL_INT_COLUMNS = ("event_type", "category", "label_id", "all_day")
+TIMEZONE_COLUMNS = ("start_timezone", "end_timezone")
+STRING_COLUMNS = (
+    "uuid",
+    "title",
+    "note",
+    "url",
+    "location",
+    "location_lat",
+    "location_lon",
+    "parent_id",
+)
+# Lists of alerts and recurrences, stored as JSON text
+JSON_COLUMNS = ("alerts", "recurrences")
+
+
+def null_value(column: array) -> int:
+    """Return the value marking a missing value in an integer column."""
+    return INT16_NULL if column.typecode == "h" else INT64_NULL
+
+
+def widen(column: array) -> array:
+    """Return an int16 column as an int64 column, keeping the missing values."""
+    return array("q", (INT64_NULL if v == INT16_NULL else v for v in column))
+
+
+class StringColumn:
+    """Column of optional strings stored as offsets into a UTF-8 buffer"""
+
+    def __init__(self):
+        self.offsets = array("q", [0])
+        self.data = bytearray()
+        self.nulls = bytearray()
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def append(self, value: str):
+        """Append a string, or None."""
+        if value is not None:
+            self.data += str(value).encode("UTF-8")
+        self.offsets.append(len(self.data))
+        self.nulls.append(value is None)
+
+    def __getitem__(self, index: int) -> str:
+        if self.nulls[index]:
+            return None
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].decode("UTF-8")
+
+    def slice(self, start: int, stop: int) -> "StringColumn":
+        """Return the rows start to stop as a new column."""
+        column = StringColumn()
+        base, end = self.offsets[start], self.offsets[stop]
+        column.data = self.data[base:end]
+        column.offsets = array(
+            "q", (offset - base for offset in self.offsets[start : stop + 1])
+        )
+        column.nulls = self.nulls[start:stop]
+        return column
+
+    def take(self, indices: Iterable[int]) -> "StringColumn":
+        """Return the given rows as a new column."""
+        column = StringColumn()
+        offsets, data = self.offsets, self.data
+        for index in indices:
+            column.data += data[offsets[index] : offsets[index + 1]]
+            column.offsets.append(len(column.data))
+            column.nulls.append(self.nulls[index])
+        return column
+
+
+class TimeTreeEventTable:
+    """
+    Columnar store of TimeTree events.
+
+    Supports appending, slicing (table[a:b]), filtering with boolean masks and
+    row views (table[i]) that can be passed to ICalEventFormatter.
+    """
+
+    def __init__(self):
+        self.timestamps = {name: array("q") for name in TIMESTAMP_COLUMNS}
+        self.small_ints = {name: array("h") for name in SMALL_INT_COLUMNS}
+        # Timezone columns hold codes into the shared list of timezone names
+        self.timezone_names = []
+        self.timezone_codes = {}
+        self.timezones = {name: array("H") for name in TIMEZONE_COLUMNS}
+        self.strings = {name: StringColumn() for name in STRING_COLUMNS + JSON_COLUMNS}
+
+    def __len__(self):
+        return len(self.timestamps["start_at"])
+
+    @classmethod
+    def from_dicts(cls, events: Iterable[dict]) -> "TimeTreeEventTable":
+        """Create a table from JSON events"""
+        table = cls()
+        for event_data in events:
+            table.append_dict(event_data)
+        return table
+
+    @classmethod
+    def from_events(cls, events: Iterable) -> "TimeTreeEventTable":
+        """Create a table from TimeTreeEvent objects"""
+        table = cls()
+        for event in events:
+            table.append(event)
+        return table
+
+    def timezone_code(self, name: str) -> int:
+        """Return the dictionary code of a timezone name, adding it if needed."""
+        code = self.timezone_codes.get(name)
+        if code is None:
+            code = len(self.timezone_names)
+            self.timezone_names.append(name)
+            self.timezone_codes[name] = code
+        return code
+
+    def append_dict(self, event_data: dict):
+        """Append a JSON event."""
+        get = event_data.get
+        self.append_values({attribute: get(key) for attribute, key in EVENT_FIELDS})
+
+    def append(self, event):
+        """Append a TimeTreeEvent, or any object with the same attributes."""
+        self.append_values(
+            {attribute: getattr(event, attribute) for attribute, _ in EVENT_FIELDS}
+        )
+
+    def append_values(self, values: dict):
+        """Append an event given as a dict of TimeTreeEvent attributes."""
+        for name, column in self.timestamps.items():
+            value = values[name]
+            column.append(INT64_NULL if value is None else int(value))
+        values["label_id"] = label_to_int(values["label_id"])
+        for name, column in self.small_ints.items():
+            value = values[name]
+            if value is None:
+                value = null_value(column)
+            else:
+                value = int(value)
+                if column.typecode == "h" and not INT16_NULL < value <= INT16_MAX:
+                    column = self.small_ints[name] = widen(column)
+            column.append(value)
+        for name, column in self.timezones.items():
+            column.append(self.timezone_code(values[name]))
+        for name in STRING_COLUMNS:
+            self.strings[name].append(values[name])
+        for name in JSON_COLUMNS:
+            value = values[name]
+            self.strings[name].append(None if value is None else json.dumps(value))
+
+    def value(self, name: str, index: int):
+        """Return the value of a field of a row, decoded to its Python type."""
+        if name in self.timestamps:
+            value = self.timestamps[name][index]
+            return None if value == INT64_NULL else value
+        if name in self.small_ints:
+            column = self.small_ints[name]
+            value = column[index]
+            if value == null_value(column):
+                return None
+            return bool(value) if name == "all_day" else value
+        if name in self.timezones:
+            return self.timezone_names[self.timezones[name][index]]
+        value = self.strings[name][index]
+        if name in JSON_COLUMNS and value is not None:
+            return json.loads(value)
+        return value
+
+    def column(self, name: str) -> list:
+        """Return all values of a field, decoded to their Python type."""
+        if name in self.timestamps or name in self.small_ints:
+            values = self.timestamps.get(name) or self.small_ints[name]
+            null = null_value(values)
+            return [None if value == null else value for value in values]
+        if name in self.timezones:
+            names = self.timezone_names
+            return [names[code] for code in self.timezones[name]]
+        return [self.value(name, index) for index in range(len(self))]
+
+    def raw_column(self, name: str) -> array:
+        """Return the underlying array of an integer or timezone code column."""
+        if name in self.timestamps:
+            return self.timestamps[name]
+        if name in self.small_ints:
+            return self.small_ints[name]
+        return self.timezones[name]
+
+    def mask(self, name: str, predicate: Callable) -> list:
+        """Return a boolean mask of the rows whose raw integer value matches."""
+        return list(map(predicate, self.raw_column(name)))
+
+    def between(self, name: str, start: int = None, end: int = None) -> list:
+        """Return a boolean mask of the rows with start <= value < end."""
+        column = self.raw_column(name)
+        start = INT64_NULL + 1 if start is None else start
+        end = -INT64_NULL if end is None else end
+        return [start <= value < end for value in column]
+
+    def equals(self, name: str, value) -> list:
+        """Return a boolean mask of the rows whose field equals the value."""
+        if name in self.timezones:
+            code = self.timezone_codes.get(value)
+            return [c == code for c in self.timezones[name]]
+        if name == "label_id":
+            value = label_to_int(value)
+        column = self.raw_column(name)
+        return [v == value for v in column]
+
+    def empty_like(self) -> "TimeTreeEventTable":
+        """Return an empty table sharing the timezone dictionary."""
+        table = TimeTreeEventTable()
+        table.timezone_names = list(self.timezone_names)
+        table.timezone_codes = dict(self.timezone_codes)
+        return table
+
+    def slice(self, start: int, stop: int) -> "TimeTreeEventTable":
+        """Return the rows start to stop as a new table."""
+        table = self.empty_like()
+        for columns, new_columns in self.int_columns(table):
+            for name, column in columns.items():
+                new_columns[name] = column[start:stop]
+        for name, column in self.strings.items():
+            table.strings[name] = column.slice(start, stop)
+        return table
+
+    def take(self, indices: Iterable[int]) -> "TimeTreeEventTable":
+        """Return the given rows as a new table."""
+        indices = list(indices)
+        table = self.empty_like()
+        for columns, new_columns in self.int_columns(table):
+            for name, column in columns.items():
+                new_columns[name] = array(
+                    column.typecode, map(column.__getitem__, indices)
+                )
+        for name, column in self.strings.items():
+            table.strings[name] = column.take(indices)
+        return table
+
+    def filter(self, mask: Iterable[bool]) -> "TimeTreeEventTable":
+        """Return the rows selected by a boolean mask as a new table."""
+        return self.take(itertools.compress(range(len(self)), mask))
+
+    def int_columns(self, other: "TimeTreeEventTable") -> list:
+        """Pair the integer column groups of this table with those of another."""
+        return [
+            (self.timestamps, other.timestamps),
+            (self.small_ints, other.small_ints),
+            (self.timezones, other.timezones),
+        ]
+
+    def row(self, index: int) -> "TimeTreeEventRow":
+        """Return a view of a row."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TimeTreeEventTable index out of range")
+        return TimeTreeEventRow(self, index)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.slice(start, max(start, stop))
+            return self.take(range(start, stop, step))
+        return self.row(key)
+
+    def __iter__(self) -> Iterator["TimeTreeEventRow"]:
+        for index in range(len(self)):
+            yield TimeTreeEventRow(self, index)
+
+
+def row_field(name: str) -> property:
+    """Return a property reading a field of the row from its table."""
+    return property(
+        lambda row: row.table.value(name, row.index),
+        doc=f"The {name} of the event.",
+    )
+
+
+class TimeTreeEventRow(TimeTreeEventBase):
+    """
+    View of a row of a TimeTreeEventTable with the attributes of a TimeTreeEvent.
+    Fields are decoded from the columns when accessed.
+    """
+
+    __slots__ = ("table", "index")
+
+    uuid = row_field("uuid")
+    title = row_field("title")
+    created_at = row_field("created_at")
+    updated_at = row_field("updated_at")
+    recurrences = row_field("recurrences")
+    alerts = row_field("alerts")
+    url = row_field("url")
+    note = row_field("note")
+    start_at = row_field("start_at")
+    end_at = row_field("end_at")
+    all_day = row_field("all_day")
+    start_timezone = row_field("start_timezone")
+    end_timezone = row_field("end_timezone")
+    location_lat = row_field("location_lat")
+    location_lon = row_field("location_lon")
+    location = row_field("location")
+    parent_id = row_field("parent_id")
+    event_type = row_field("event_type")
+    category = row_field("category")
+    label_id = row_field("label_id")
+
+    def __init__(self, table: TimeTreeEventTable, index: int):
+        self.table = table
+        self.index = index
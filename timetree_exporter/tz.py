@@ -0,0 +1,353 @@
+"""
+This module provides a shared registry of the timezones used by TimeTree events.
+
+Each timezone name is resolved to a ZoneInfo once, and the UTC offsets of the
+timezone are precomputed as a transition table for the date span of the
+export. Converting a timestamp to local time is then a binary search in the
+table and an addition, without building datetime objects.
+
+The VTIMEZONE components of the timezones are generated once per tzdata
+version and date range, and cached in memory and, optionally, on disk.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import zoneinfo
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Sequence
+from zoneinfo import ZoneInfo
+
+import icalendar
+from icalendar import Timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+SECOND = 1000
+DAY = 24 * 3600 * SECOND
+# Offsets are sampled weekly, timezones never change twice within a week
+SAMPLE_STEP = 7 * DAY
+# Span of the offset tables unless the registry is given the export's span
+DEFAULT_START = 0
+DEFAULT_END = int(datetime(2040, 1, 1, tzinfo=timezone.utc).timestamp()) * SECOND
+
+
+def offset_at(zone: ZoneInfo, timestamp: int) -> int:
+    """Return the UTC offset of the timezone at the timestamp, in milliseconds."""
+    local = (EPOCH + timedelta(milliseconds=timestamp)).astimezone(zone)
+    return local.utcoffset() // timedelta(milliseconds=1)
+
+
+class OffsetTable:
+    """
+    UTC offsets of a timezone between two timestamps in milliseconds, with the
+    timestamps at which they change. Offsets outside the span are computed
+    with zoneinfo directly.
+    """
+
+    def __init__(self, zone: ZoneInfo, start: int, end: int, step: int = SAMPLE_STEP):
+        self.zone = zone
+        self.start = start
+        self.end = end
+        self.transitions = array("q", [start])
+        self.offsets = array("q", [offset_at(zone, start)])
+
+        # Sample the offset every step and locate each change to the second
+        previous = start
+        for sample in range(start + step, end + step, step):
+            sample = min(sample, end)
+            if offset_at(zone, sample) != self.offsets[-1]:
+                low, high = previous, sample
+                while high - low > SECOND:
+                    middle = (low + high) // 2 // SECOND * SECOND
+                    if middle <= low:
+                        break
+                    if offset_at(zone, middle) == self.offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                self.transitions.append(high)
+                self.offsets.append(offset_at(zone, high))
+            previous = sample
+
+    def offset(self, timestamp: int) -> int:
+        """Return the UTC offset at the timestamp, in milliseconds."""
+        if not self.start <= timestamp < self.end:
+            return offset_at(self.zone, timestamp)
+        return self.offsets[bisect_right(self.transitions, timestamp) - 1]
+
+    def local(self, timestamp: int) -> int:
+        """Return the local wall-clock time of the timestamp, in milliseconds."""
+        return timestamp + self.offset(timestamp)
+
+    def localize(self, timestamps: Iterable[int]) -> array:
+        """
+        Return the wall-clock times of many timestamps in one pass. Runs of
+        increasing timestamps walk the table instead of searching it.
+        """
+        transitions, offsets = self.transitions, self.offsets
+        last = len(transitions) - 1
+        start, end = self.start, self.end
+        result = array("q")
+        append = result.append
+        index = 0
+        previous = end
+        for timestamp in timestamps:
+            if not start <= timestamp < end:
+                append(timestamp + offset_at(self.zone, timestamp))
+                continue
+            if timestamp < previous:
+                index = bisect_right(transitions, timestamp) - 1
+            else:
+                while index < last and transitions[index + 1] <= timestamp:
+                    index += 1
+            previous = timestamp
+            append(timestamp + offsets[index])
+        return result
+
+
+@lru_cache(maxsize=32768)
+def format_local_date(days: int) -> str:
+    """Format the date days after 1970-01-01 as a DATE value (YYYYMMDD)."""
+    day = date.fromordinal(EPOCH_ORDINAL + days)
+    return f"{day.year:04}{day.month:02}{day.day:02}"
+
+
+def split_local(local: int) -> tuple:
+    """Split a wall-clock time in milliseconds into days since 1970 and seconds."""
+    days, milliseconds = divmod(local, DAY)
+    return days, milliseconds // SECOND
+
+
+@lru_cache(maxsize=8192)
+def format_time_of_day(seconds: int) -> str:
+    """Format the seconds since midnight as the time part of a DATE-TIME value."""
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"T{hours:02}{minutes:02}{seconds:02}"
+
+
+def format_local_datetime(local: int) -> str:
+    """Format a wall-clock time in milliseconds as a DATE-TIME value."""
+    days, milliseconds = divmod(local, DAY)
+    return format_local_date(days) + format_time_of_day(milliseconds // SECOND)
+
+
+def format_local_datetimes(local_times: Iterable[int]) -> list:
+    """Format many wall-clock times in milliseconds as DATE-TIME values."""
+    result = []
+    append = result.append
+    for local in local_times:
+        days, milliseconds = divmod(local, DAY)
+        append(format_local_date(days) + format_time_of_day(milliseconds // SECOND))
+    return result
+
+
+class TimezoneRegistry:
+    """
+    Resolves timezone names to ZoneInfo objects and offset tables, once each.
+    Safe to share between threads.
+    """
+
+    def __init__(self, start: int = DEFAULT_START, end: int = DEFAULT_END):
+        self.start = start
+        self.end = end
+        self.zones = {}
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def set_span(self, start: int = None, end: int = None):
+        """
+        Precompute the offset tables for the span of the export, in milliseconds.
+        Tables built for a previous span are discarded.
+        """
+        with self.lock:
+            self.start = DEFAULT_START if start is None else start
+            self.end = DEFAULT_END if end is None else end
+            self.tables = {}
+
+    def zone(self, name: str) -> ZoneInfo:
+        """Return the ZoneInfo of the timezone name."""
+        zone = self.zones.get(name)
+        if zone is None:
+            zone = self.zones.setdefault(name, ZoneInfo(name))
+        return zone
+
+    def table(self, name: str) -> OffsetTable:
+        """Return the offset table of the timezone name."""
+        table = self.tables.get(name)
+        if table is None:
+            zone = self.zone(name)
+            with self.lock:
+                table = self.tables.get(name)
+                if table is None:
+                    table = OffsetTable(zone, self.start, self.end)
+                    self.tables[name] = table
+        return table
+
+    def local(self, timestamp: int, name: str) -> int:
+        """Return the wall-clock time of a timestamp in the timezone, in milliseconds."""
+        return self.table(name).local(timestamp)
+
+    def localize(self, timestamps: Sequence[int], names: Sequence[str]) -> array:
+        """
+        Return the wall-clock times of timestamps in milliseconds, each in the
+        timezone of the same index, converting all the timestamps of a timezone
+        in one pass.
+        """
+        groups = {}
+        for index, name in enumerate(names):
+            groups.setdefault(name, []).append(index)
+        if len(groups) == 1:
+            return self.table(names[0]).localize(timestamps)
+        result = array("q", bytes(8 * len(timestamps)))
+        for name, indices in groups.items():
+            local = self.table(name).localize(map(timestamps.__getitem__, indices))
+            for index, value in zip(indices, local):
+                result[index] = value
+        return result
+
+    def to_datetime(self, timestamp: int, name: str) -> datetime:
+        """Return the timestamp in milliseconds as an aware datetime in the timezone."""
+        zone = self.zone(name)
+        if timestamp < 0:
+            # Not supported by fromtimestamp on every platform
+            return (EPOCH + timedelta(milliseconds=timestamp)).astimezone(zone)
+        # Converted in C by zoneinfo, faster than going through the offset table
+        seconds, milliseconds = divmod(timestamp, SECOND)
+        result = datetime.fromtimestamp(seconds, zone)
+        if milliseconds:
+            result = result.replace(microsecond=milliseconds * 1000)
+        return result
+
+
+# Registry shared by the formatter and the writers
+registry = TimezoneRegistry()
+
+
+@lru_cache(maxsize=None)
+def tzdata_version() -> str:
+    """
+    Return the version of the tzdata used by zoneinfo, or None if unknown.
+    Like zoneinfo, the system timezone database is preferred to the tzdata package.
+    """
+    for directory in zoneinfo.TZPATH:
+        if not os.path.isdir(directory):
+            continue
+        for name, prefix in (("tzdata.zi", "# version "), ("+VERSION", "")):
+            try:
+                with open(os.path.join(directory, name), encoding="UTF-8") as f:
+                    line = f.readline().strip()
+            except OSError:
+                continue
+            if line.startswith(prefix) and line[len(prefix) :]:
+                return line[len(prefix) :]
+        # The database in use has no version
+        return None
+    try:
+        import tzdata  # pylint: disable=C0415
+    except ImportError:
+        return None
+    return tzdata.IANA_VERSION
+
+
+class VTimezoneCache:
+    """
+    VTIMEZONE components by TZID, generated from zoneinfo for the dates between
+    first_date and last_date. Components are kept in memory and, once a cache
+    directory is set, in files keyed by TZID, tzdata and icalendar versions and
+    date range.
+    Without a known tzdata version nothing is cached on disk. Safe to share
+    between threads.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        first_date: date = date(1970, 1, 1),
+        last_date: date = date(2038, 1, 1),
+    ):
+        self.directory = directory
+        self.first_date = first_date
+        self.last_date = last_date
+        self.components = {}
+        self.lock = threading.Lock()
+
+    def set_cache_dir(self, cache_dir: str):
+        """Keep the generated components in the timezones directory of the cache."""
+        self.directory = os.path.join(cache_dir, "timezones")
+
+    def path(self, tzid: str) -> str:
+        """Return the path of the cached component, or None if not cached on disk."""
+        version = tzdata_version()
+        if self.directory is None or version is None:
+            return None
+        # The component also depends on the icalendar version generating it
+        key = "\n".join(
+            [
+                tzid,
+                version,
+                icalendar.__version__,
+                str(self.first_date),
+                str(self.last_date),
+            ]
+        )
+        digest = hashlib.sha256(key.encode("UTF-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.ics")
+
+    def load(self, path: str) -> bytes:
+        """Return the component cached at path, or None."""
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save(self, path: str, component: bytes):
+        """Cache the component at path, ignoring a cache that can't be written."""
+        if path is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(component)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+    def get(self, tzid: str) -> bytes:
+        """Return the VTIMEZONE component of the TZID, or None if unknown."""
+        key = (tzid, self.first_date, self.last_date)
+        if key in self.components:
+            return self.components[key]
+        with self.lock:
+            if key not in self.components:
+                path = self.path(tzid)
+                component = self.load(path)
+                if component is None:
+                    try:
+                        component = Timezone.from_tzid(
+                            tzid, first_date=self.first_date, last_date=self.last_date
+                        ).to_ical()
+                    except ValueError:
+                        component = None
+                    else:
+                        self.save(path, component)
+                self.components[key] = component
+            return self.components[key]
+
+    def to_ical(self, tzids: Iterable[str]) -> bytes:
+        """Return the VTIMEZONE components of the TZIDs known to zoneinfo."""
+        components = (self.get(tzid) for tzid in sorted(tzids))
+        return b"".join(component for component in components if component)
+
+
+# VTIMEZONE components shared by the writers
+vtimezones = VTimezoneCache()
@@ -2,15 +2,21 @@
 
 import json
 import os
+import stat
 import logging
 import inspect
 import getpass
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from typing import Iterable, Iterator
 from zoneinfo import ZoneInfo
 
-
 logger = logging.getLogger(__name__)
 
+# Marker in a stream of events ending the batch being collected by iter_batches
+FLUSH = object()
+
 
 def get_events_from_file(file_path) -> list:
     """Fetch events from Timetree response file"""
@@ -44,13 +50,108 @@ def paths_to_filelist(paths: list) -> list:
     return filenames
 
 
+def get_cache_dir(cache_dir: str = None) -> str:
+    """
+    Return the directory used for local state and caches, creating it if needed.
+    Defaults to $TIMETREE_CACHE_DIR, then $XDG_CACHE_HOME/timetree-exporter.
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get("TIMETREE_CACHE_DIR")
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.join("~", ".cache")),
+            "timetree-exporter",
+        )
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def write_json_atomic(path: str, data, mode: int = None):
+    """
+    Write data as JSON to a temporary file and move it into place,
+    so that readers never see a partially written file. The file is created
+    with the given permissions, or else readable by the owner only.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w", encoding="UTF-8") as json_file:
+            json.dump(data, json_file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Yield the items in lists of up to size items. A FLUSH marker ends the
+    current batch early, even if empty, so that the consumer hands over the
+    items already received without waiting for more.
+    """
+    batch = []
+    for item in items:
+        if item is FLUSH:
+            yield batch
+            batch = []
+            continue
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def new_file_mode(path: str) -> int:
+    """
+    Return the permissions of a file replacing the file at path: those of the
+    existing file, or else readable by everyone and writable by the owner.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o644
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on the file at path, shared with other processes.
+    """
+    with open(path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt  # pylint: disable=C0415,E0401
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl  # pylint: disable=C0415
+
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
 def convert_timestamp_to_datetime(timestamp, tzinfo=ZoneInfo("UTC")):
     """
     Convert timestamp to datetime for both positive and negative timestamps on different platforms.
     """
     if timestamp >= 0:
         return datetime.fromtimestamp(timestamp, tzinfo)
-    return datetime.fromtimestamp(0, tzinfo) + timedelta(seconds=int(timestamp))
+    # Converted from UTC so that the offset in effect at the time is used
+    return (
+        datetime.fromtimestamp(0, ZoneInfo("UTC")) + timedelta(seconds=timestamp)
+    ).astimezone(tzinfo)
 
 
 def safe_getpass(prompt="Password: ", echo_char=None):